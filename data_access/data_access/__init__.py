@@ -1,3 +1,4 @@
 from .db_client import DBClient
+from .single_flight import SingleFlight
 
-__all__ = ["DBClient"]
+__all__ = ["DBClient", "SingleFlight"]
@@ -12,26 +12,436 @@ license: MIT, see LICENSE for more details.
 
 import json
 import os
+import random
+import time
+
 import redis
+from redis.sentinel import Sentinel
+
+# Number of change events kept per park.
+CHANGES_MAXLEN = 10000
+
+# Seconds a replica that failed to respond is skipped, and seconds a
+# replica's replication status is trusted before checking it again.
+REPLICA_RETRY_AFTER = 5.0
+REPLICA_CHECK_INTERVAL = 1.0
+
+# Seconds replica addresses discovered through Sentinel are reused.
+SENTINEL_DISCOVERY_INTERVAL = 10.0
+
+# Replica state is shared by all clients in the process, mapping replica
+# names to the time they may be retried and to (time checked, current),
+# and Sentinel service names to (time discovered, replica addresses).
+_replica_retry_at = {}
+_replica_checks = {}
+_sentinel_replicas = {}
+
+# Lua scripts run server side, so that only matching experiences and
+# requested fields are sent over the wire. Filter values are expected in
+# lower case. Both return false if the requested record doesn't exist.
+PROJECT_EXPERIENCE = """
+local data = redis.call('HGET', KEYS[1], ARGV[1])
+if not data or #ARGV == 1 then
+    return data
+end
+local experience = cjson.decode(data)
+local projected = {}
+for i = 2, #ARGV do
+    projected[ARGV[i]] = experience[ARGV[i]]
+end
+return cjson.encode(projected)
+"""
 
+FILTER_EXPERIENCES = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+local exp_type, status = ARGV[1], ARGV[2]
+local matches = {}
+for _, data in ipairs(redis.call('HVALS', KEYS[1])) do
+    local experience = cjson.decode(data)
+    local status_info = experience['statusInfo']
+    local match = exp_type == '' or string.lower(experience['type']) == exp_type
+    if match and status ~= '' then
+        match = type(status_info) == 'table'
+            and type(status_info['status']) == 'string'
+            and string.lower(status_info['status']) == status
+    end
+    if match and #ARGV == 2 then
+        matches[#matches + 1] = data
+    elseif match then
+        local projected = {}
+        for i = 3, #ARGV do
+            projected[ARGV[i]] = experience[ARGV[i]]
+        end
+        matches[#matches + 1] = cjson.encode(projected)
+    end
+end
+return matches
+"""
 
-class DBClient:
-    """DB client to interact with Redis."""
-
-    def __init__(self):
-        self.r = redis.Redis(
-            host=os.environ["REDIS_HOST"],
-            port=os.environ["REDIS_PORT"],
-            password=os.environ["REDIS_PASSWORD"],
-            charset="utf-8",
-            decode_responses=True,
+TOP_WAITS = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return false
+end
+local ids
+if ARGV[1] == 'desc' then
+    ids = redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+else
+    ids = redis.call('ZRANGE', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+end
+if #ids == 0 then
+    return ids
+end
+return redis.call('HMGET', KEYS[2], unpack(ids))
+"""
+
+# Members of the resort-wide sets are '{park_id}:{experience_id}', and
+# the park's experiences hash is derived from each, so the key can't be
+# declared up front. Returns park IDs and JSON encoded experiences in
+# turn.
+TOP_WAITS_RESORT = """
+local members
+if ARGV[1] == 'desc' then
+    members = redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+else
+    members = redis.call('ZRANGE', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+end
+local results = {}
+for _, member in ipairs(members) do
+    local park_id, experience_id = string.match(member, '^([^:]+):(.+)$')
+    local data = redis.call('HGET', park_id .. ':experiences', experience_id)
+    if data then
+        results[#results + 1] = park_id
+        results[#results + 1] = data
+    end
+end
+return results
+"""
+
+
+def _discover_replicas(sentinel, service):
+    """Get the addresses of a service's replicas from Sentinel."""
+
+    discovered = _sentinel_replicas.get(service)
+    if (
+        discovered is None
+        or time.monotonic() - discovered[0] > SENTINEL_DISCOVERY_INTERVAL
+    ):
+        discovered = _sentinel_replicas[service] = (
+            time.monotonic(),
+            sentinel.discover_slaves(service),
         )
+    return discovered[1]
+
+
+def _parse_addresses(value):
+    """Parse a 'host:port,host:port' string into (host, port) tuples."""
+
+    addresses = []
+    for address in value.split(","):
+        if address.strip():
+            host, _, port = address.strip().rpartition(":")
+            addresses.append((host, int(port)))
+    return addresses
+
+
+class DBClient:
+    """DB client to interact with Redis.
+
+    Writes go to the primary. Reads go to a replica if any are
+    configured, falling back to other replicas and then the primary
+    when a replica fails to respond or lags behind. The server is
+    picked on the first read and used for all reads of the instance, so
+    that they see the same data.
+
+    Parameters
+    ----------
+    primary : tuple, optional
+        (host, port) of the primary, defaults to $REDIS_HOST:$REDIS_PORT.
+    replicas : list of tuples, optional
+        (host, port) of each replica, defaults to the comma separated
+        host:port list in $REDIS_REPLICAS.
+    sentinels : list of tuples, optional
+        (host, port) of Sentinels used to discover the primary and
+        replicas instead, defaults to the list in $REDIS_SENTINELS. The
+        monitored service is named by $REDIS_SENTINEL_SERVICE.
+    max_replica_lag : float, optional
+        Seconds since a replica last heard from the primary before it
+        is considered stale, defaults to $REDIS_MAX_REPLICA_LAG or 30.
+    read_from_primary : bool, optional
+        Read from the primary only, for reads that later writes depend on.
+
+    """
+
+    def __init__(
+        self,
+        *,
+        primary=None,
+        replicas=None,
+        sentinels=None,
+        max_replica_lag=None,
+        read_from_primary=False,
+    ):
+        if sentinels is None:
+            sentinels = _parse_addresses(os.environ.get("REDIS_SENTINELS", ""))
+        if replicas is None:
+            replicas = _parse_addresses(os.environ.get("REDIS_REPLICAS", ""))
+        if max_replica_lag is None:
+            max_replica_lag = float(os.environ.get("REDIS_MAX_REPLICA_LAG", 30))
+        self.max_replica_lag = max_replica_lag
+        self.read_from_primary = read_from_primary
+        # (name, client) of the server picked for reads, name is None for
+        # the primary.
+        self._read_client = None
+
+        options = {
+            "password": os.environ["REDIS_PASSWORD"],
+            "charset": "utf-8",
+            "decode_responses": True,
+        }
+        if sentinels:
+            service = os.environ.get("REDIS_SENTINEL_SERVICE", "mymaster")
+            sentinel = Sentinel(sentinels, **options)
+            self.r = sentinel.master_for(service)
+            # Replicas are connected to one by one, so that each one's
+            # replication status is checked.
+            replicas = _discover_replicas(sentinel, service)
+        else:
+            host, port = primary or (os.environ["REDIS_HOST"], os.environ["REDIS_PORT"])
+            self.r = redis.Redis(host=host, port=port, **options)
+        self.replicas = [
+            (f"{host}:{port}", redis.Redis(host=host, port=port, **options))
+            for host, port in replicas
+        ]
+        # Scripts are called with EVALSHA, and only loaded on a cache miss.
+        self._project_experience = self.r.register_script(PROJECT_EXPERIENCE)
+        self._filter_experiences = self.r.register_script(FILTER_EXPERIENCES)
+        self._top_waits = self.r.register_script(TOP_WAITS)
+        self._top_waits_resort = self.r.register_script(TOP_WAITS_RESORT)
 
     def __enter__(self,):
         return self
 
     def __exit__(self, *args):
         self.r.connection_pool.disconnect()
+        for _, replica in self.replicas:
+            replica.connection_pool.disconnect()
+
+    def _replica_is_current(self, name, replica):
+        """Check that a replica is connected to and in sync with the primary."""
+
+        checked = _replica_checks.get(name)
+        if checked is None or time.monotonic() - checked[0] > REPLICA_CHECK_INTERVAL:
+            info = replica.info("replication")
+            current = (
+                info.get("master_link_status") == "up"
+                and info.get("master_last_io_seconds_ago", -1) >= 0
+                and info["master_last_io_seconds_ago"] <= self.max_replica_lag
+            )
+            checked = _replica_checks[name] = (time.monotonic(), current)
+        return checked[1]
+
+    def _pick_reader(self):
+        """Pick a replica for reads, or the primary.
+
+        Replicas are tried in random order, skipping those that are
+        stale or recently failed to respond.
+
+        Returns
+        -------
+        tuple
+            Name and `redis.Redis` client, name is None for the primary.
+
+        """
+
+        if self.read_from_primary:
+            return None, self.r
+        now = time.monotonic()
+        replicas = [
+            (name, replica)
+            for name, replica in self.replicas
+            if _replica_retry_at.get(name, 0) <= now
+        ]
+        random.shuffle(replicas)
+        for name, replica in replicas:
+            try:
+                if self._replica_is_current(name, replica):
+                    return name, replica
+            except (redis.ConnectionError, redis.TimeoutError):
+                _replica_retry_at[name] = time.monotonic() + REPLICA_RETRY_AFTER
+        return None, self.r
+
+    def _reader(self):
+        """Get the client used for all reads of this instance."""
+
+        if self._read_client is None:
+            self._read_client = self._pick_reader()
+        return self._read_client[1]
+
+    def _read(self, command):
+        """Run a read command on the client picked for reads.
+
+        If a replica fails to respond, the command and later reads of
+        this instance go to the primary.
+
+        Parameters
+        ----------
+        command : callable
+            Called with a `redis.Redis` client, returns the result.
+
+        """
+
+        client = self._reader()
+        name = self._read_client[0]
+        if name is None:
+            return command(client)
+        try:
+            return command(client)
+        except (redis.ConnectionError, redis.TimeoutError):
+            _replica_retry_at[name] = time.monotonic() + REPLICA_RETRY_AFTER
+            self._read_client = None, self.r
+            return command(self.r)
+
+    def read_coalesced(self, *, key, fetch, lock_timeout=1.0, result_ttl=2.0):
+        """Read a value computed once across all processes sharing the DB.
+
+        The first caller takes a short lock in Redis, calls `fetch` and
+        stores the JSON encoded result under a result key for
+        `result_ttl` seconds. Concurrent callers poll the result key
+        instead of calling `fetch` themselves, and fall back to calling
+        it if no result shows up before the lock expires.
+
+        Only the lock is taken on the primary, the result key is read
+        like any other data. The lock is left to expire rather than
+        released, so callers reading from a replica the result hasn't
+        reached yet wait for it instead of fetching again.
+
+        Parameters
+        ----------
+        key : str
+            Identifies the value, should change when the data changes.
+        fetch : callable
+            Called without arguments to produce a JSON serializable value.
+        lock_timeout : float, optional
+            Seconds before the lock expires.
+        result_ttl : float, optional
+            Seconds the result is kept.
+
+        Returns
+        -------
+        object
+            Decoded value.
+
+        """
+
+        lock_key = f"flight:{key}:lock"
+        result_key = f"flight:{key}:result"
+        result = self._read(lambda r: r.get(result_key))
+        if result is not None:
+            return json.loads(result)
+
+        if self.r.set(lock_key, 1, nx=True, px=int(lock_timeout * 1000)):
+            value = fetch()
+            self.r.set(result_key, json.dumps(value), px=int(result_ttl * 1000))
+            return value
+
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.01)
+            result = self._read(lambda r: r.get(result_key))
+            if result is not None:
+                return json.loads(result)
+        return fetch()
+
+    def read_changes(self, *, park_id, since=None, count=1000):
+        """Read experience change events for a park from DB.
+
+        Parameters
+        ----------
+        park_id : str
+            ID of park.
+        since : str, optional
+            Stream ID to read after, read from the oldest event if None.
+        count : int, optional
+            Maximum number of events to read.
+
+        Returns
+        -------
+        tuple
+            List of (stream ID, JSON encoded string) tuples, and stream
+            ID of the newest event trimmed from the stream, or None if
+            none have been.
+
+        """
+
+        db_key = f"{park_id}:changes"
+
+        def command(r):
+            pipe = r.pipeline(transaction=False)
+            pipe.xrange(db_key, min="-" if since is None else f"({since}", count=count)
+            pipe.get(f"{db_key}:trimmed")
+            return pipe.execute()
+
+        entries, trimmed = self._read(command)
+        return [(stream_id, fields["data"]) for stream_id, fields in entries], trimmed
+
+    def read_forecast(self, *, park_id, experience_id):
+        """Read wait time forecasts for one experience from DB.
+
+        Parameters
+        ----------
+        park_id : str
+            ID of park.
+        experience_id : str
+            ID of experience.
+
+        Returns
+        -------
+        str or None
+            JSON encoded string if match is found.
+
+        """
+
+        db_key = f"{park_id}:forecasts"
+        return self._read(lambda r: r.hget(db_key, experience_id))
+
+    def read_history(self, *, park_id):
+        """Read the posted wait history of a park from DB.
+
+        Parameters
+        ----------
+        park_id : str
+            ID of park.
+
+        Returns
+        -------
+        list
+            JSON encoded strings of samples, oldest first.
+
+        """
+
+        db_key = f"{park_id}:history"
+        return self._read(lambda r: r.zrange(db_key, 0, -1))
+
+    def read_history_time(self, *, park_id):
+        """Read the time of the latest sample in a park's history from DB.
+
+        Parameters
+        ----------
+        park_id : str
+            ID of park.
+
+        Returns
+        -------
+        float or None
+            Unix timestamp if the park has any history.
+
+        """
+
+        db_key = f"{park_id}:history"
+        latest = self._read(lambda r: r.zrevrange(db_key, 0, 0, withscores=True))
+        return latest[0][1] if latest else None
 
     def read_experience(self, *, park_id, experience_id):
         """Read one experience from DB.
@@ -51,7 +461,63 @@ class DBClient:
         """
 
         db_key = f"{park_id}:experiences"
-        return self.r.hget(db_key, experience_id)
+        return self._read(lambda r: r.hget(db_key, experience_id))
+
+    def read_experience_fields(self, *, park_id, experience_id, fields):
+        """Read selected fields of one experience from DB.
+
+        Parameters
+        ----------
+        park_id : str
+            ID of park.
+        experience_id : str
+            ID of experience.
+        fields : list of str
+            Top-level fields to return.
+
+        Returns
+        -------
+        str or None
+            JSON encoded string if match is found.
+
+        """
+
+        db_key = f"{park_id}:experiences"
+        return self._read(
+            lambda r: self._project_experience(
+                keys=[db_key], args=[experience_id, *fields], client=r
+            )
+        )
+
+    def read_experiences_filtered(self, *, park_id, _type="", status="", fields=()):
+        """Read experiences in a park matching filters from DB.
+
+        Filtering and projection are done by a Lua script on the server.
+
+        Parameters
+        ----------
+        park_id : str
+            ID of park.
+        _type : str, optional
+            Experience type to match, case-insensitive.
+        status : str, optional
+            Experience status to match, case-insensitive.
+        fields : list of str, optional
+            Top-level fields to return, all fields if empty.
+
+        Returns
+        -------
+        list or None
+            JSON encoded strings of matches, None if park is not found.
+
+        """
+
+        db_key = f"{park_id}:experiences"
+        return self._read(
+            lambda r: self._filter_experiences(
+                keys=[db_key], args=[_type.lower(), status.lower(), *fields], client=r
+            )
+        )
 
     def read_experiences(self, *, park_id):
         """Read all experiences in a park from DB.
@@ -69,7 +535,109 @@ class DBClient:
         """
 
         db_key = f"{park_id}:experiences"
-        return self.r.hgetall(db_key)
+        return self._read(lambda r: r.hgetall(db_key))
+
+    def read_update_time(self, *, dataset, park_id):
+        """Read the time of the last update of a park's data.
+
+        Parameters
+        ----------
+        dataset : {"experiences", "parks"}
+            Dataset the update time is tracked for.
+        park_id : str
+            ID of park.
+
+        Returns
+        -------
+        str or None
+            Unix timestamp if the park's data has been written.
+
+        """
+
+        return self._read(lambda r: r.hget(f"{dataset}:updated", park_id))
+
+    def read_update_times(self, *, dataset):
+        """Read the time of the last update of all parks' data.
+
+        Parameters
+        ----------
+        dataset : {"experiences", "parks"}
+            Dataset the update times are tracked for.
+
+        Returns
+        -------
+        dict
+            Unix timestamps keyed by park ID.
+
+        """
+
+        return self._read(lambda r: r.hgetall(f"{dataset}:updated"))
+
+    def read_top_waits(self, *, park_id, _type="", order="asc", limit=10):
+        """Read experiences in a park with the shortest or longest waits.
+
+        Experiences are ranked by posted wait time through sorted sets
+        maintained by `write_experience_data`. Experiences without a
+        posted wait time are not ranked.
+
+        Parameters
+        ----------
+        park_id : str
+            ID of park.
+        _type : str, optional
+            Experience type to rank, case-insensitive.
+        order : {"asc", "desc"}, optional
+            Shortest waits first for "asc", longest first for "desc".
+        limit : int, optional
+            Maximum number of experiences to return.
+
+        Returns
+        -------
+        list or None
+            JSON encoded strings ordered by wait, None if park is not found.
+
+        """
+
+        waits_key = f"{park_id}:waits"
+        if _type:
+            waits_key = f"{waits_key}:type:{_type.lower()}"
+        return self._read(
+            lambda r: self._top_waits(
+                keys=[waits_key, f"{park_id}:experiences"],
+                args=[order, limit],
+                client=r,
+            )
+        )
+
+    def read_resort_top_waits(self, *, _type="", order="asc", limit=10):
+        """Read experiences in all parks with the shortest or longest waits.
+
+        Experiences are ranked through the resort-wide sorted sets
+        maintained by `write_experience_data`.
+
+        Parameters
+        ----------
+        _type : str, optional
+            Experience type to rank, case-insensitive.
+        order : {"asc", "desc"}, optional
+            Shortest waits first for "asc", longest first for "desc".
+        limit : int, optional
+            Maximum number of experiences to return.
+
+        Returns
+        -------
+        list
+            (park ID, JSON encoded string) tuples ordered by wait.
+
+        """
+
+        waits_key = f"waits:type:{_type.lower()}" if _type else "waits"
+        results = self._read(
+            lambda r: self._top_waits_resort(
+                keys=[waits_key], args=[order, limit], client=r
+            )
+        )
+        return list(zip(results[::2], results[1::2]))
 
     def read_park(self, park_id):
         """Read one park record from DB.
@@ -86,7 +654,7 @@ class DBClient:
 
         """
 
-        return self.r.hget("parks", park_id)
+        return self._read(lambda r: r.hget("parks", park_id))
 
     def read_parks(self):
         """Read all park records from DB.
@@ -98,14 +666,85 @@ class DBClient:
 
         """
 
-        return self.r.hgetall("parks")
+        return self._read(lambda r: r.hgetall("parks"))
+
+    def scan_experiences(self, *, park_id, count=100):
+        """Iterate over all experiences in a park with HSCAN.
 
-    def write_experience_data(self, *, park_id, data):
+        Parameters
+        ----------
+        park_id : str
+            ID of park.
+        count : int, optional
+            Number of entries to fetch per round trip.
+
+        Yields
+        ------
+        tuple
+            Experience ID and JSON encoded string.
+
+        """
+
+        db_key = f"{park_id}:experiences"
+        yield from self._reader().hscan_iter(db_key, count=count)
+
+    def scan_history(self, *, park_id, count=100):
+        """Iterate over a park's posted wait history with ZSCAN.
+
+        Samples are not returned in any particular order.
+
+        Parameters
+        ----------
+        park_id : str
+            ID of park.
+        count : int, optional
+            Number of samples to fetch per round trip.
+
+        Yields
+        ------
+        str
+            JSON encoded sample.
+
+        """
+
+        db_key = f"{park_id}:history"
+        for sample, _ in self._reader().zscan_iter(db_key, count=count):
+            yield sample
+
+    def scan_park_ids(self, *, count=100):
+        """Iterate over the IDs of all parks with experiences using SCAN.
+
+        Parameters
+        ----------
+        count : int, optional
+            Number of keys to inspect per round trip.
+
+        Yields
+        ------
+        str
+            Park ID.
+
+        """
+
+        for db_key in self._reader().scan_iter(match="*:experiences", count=count):
+            yield db_key[: -len(":experiences")]
+
+    def write_experience_data(self, *, park_id, data, changes=()):
         """Write updated experience data to DB.
 
         Deletes the existing hash first and then writes the new data.
         All operations are executed atomically through a pipeline with
-        transaction enabled, so that reads won't occur inbetween.
+        transaction enabled, so that reads won't occur inbetween. The
+        time of the update is recorded in the 'experiences:updated' hash.
+
+        Sorted sets of experience IDs scored by posted wait time are
+        rebuilt in the same transaction, one for the park and one for
+        each experience type in it. The park's members of the resort-wide
+        'waits' and 'waits:type:{type}' sets, '{park_id}:{experience_id}',
+        are replaced as well. Change events are appended to the park's
+        '{park_id}:changes' stream, capped at CHANGES_MAXLEN events. The
+        ID of the newest event trimmed from it is kept under
+        '{park_id}:changes:trimmed'.
 
         Parameters
         ----------
@@ -113,21 +752,117 @@ class DBClient:
             ID of park.
         data : dict
             Holds dicts of experience data.
+        changes : list of dicts, optional
+            Change events since the previous write.
 
         """
 
         db_key = f"{park_id}:experiences"
+        waits_key = f"{park_id}:waits"
+        types_key = f"{waits_key}:types"
+        changes_key = f"{park_id}:changes"
+        old_types = list(self.r.smembers(types_key))
+        read_pipe = self.r.pipeline(transaction=False)
+        read_pipe.xlen(changes_key)
+        for _type in old_types:
+            read_pipe.zrange(f"{waits_key}:type:{_type}", 0, -1)
+        changes_length, *old_id_lists = read_pipe.execute()
+        old_ids = dict(zip(old_types, old_id_lists))
+        # Trimming is exact, so the events dropped are known beforehand.
+        excess = changes_length + len(changes) - CHANGES_MAXLEN
+        trimmed = None
+        if changes and excess > 0:
+            trimmed = self.r.xrange(changes_key, count=excess)[-1][0]
         pipe = self.r.pipeline(transaction=True)
-        pipe.delete(db_key)
+        pipe.delete(
+            db_key,
+            waits_key,
+            types_key,
+            *(f"{waits_key}:type:{_type}" for _type in old_types),
+        )
+        for _type, experience_ids in old_ids.items():
+            if experience_ids:
+                members = [f"{park_id}:{e_id}" for e_id in experience_ids]
+                pipe.zrem("waits", *members)
+                pipe.zrem(f"waits:type:{_type}", *members)
         for experience_id, experience_data in data.items():
             pipe.hset(
                 db_key, experience_id, json.dumps(experience_data, sort_keys=True)
             )
+            status_info = experience_data.get("statusInfo") or {}
+            wait = status_info.get("postedWaitMinutes")
+            if wait is not None:
+                _type = experience_data["type"].lower()
+                pipe.zadd(waits_key, {experience_id: wait})
+                pipe.zadd(f"{waits_key}:type:{_type}", {experience_id: wait})
+                pipe.sadd(types_key, _type)
+                member = f"{park_id}:{experience_id}"
+                pipe.zadd("waits", {member: wait})
+                pipe.zadd(f"waits:type:{_type}", {member: wait})
+        for change in changes:
+            pipe.xadd(
+                changes_key,
+                {"data": json.dumps(change, sort_keys=True)},
+                maxlen=CHANGES_MAXLEN,
+                approximate=False,
+            )
+        if trimmed is not None:
+            pipe.set(f"{changes_key}:trimmed", trimmed)
+        pipe.hset("experiences:updated", park_id, time.time())
+        pipe.execute()
+
+    def write_forecasts(self, *, park_id, data):
+        """Write wait time forecasts for a park to DB.
+
+        Replaces all forecasts for the park in one transaction.
+
+        Parameters
+        ----------
+        park_id : str
+            ID of park.
+        data : dict
+            Holds dicts of forecast data keyed by experience ID.
+
+        """
+
+        db_key = f"{park_id}:forecasts"
+        pipe = self.r.pipeline(transaction=True)
+        pipe.delete(db_key)
+        for experience_id, forecast in data.items():
+            pipe.hset(db_key, experience_id, json.dumps(forecast, sort_keys=True))
+        pipe.execute()
+
+    def write_history_sample(self, *, park_id, timestamp, data, retention):
+        """Append a sample of posted waits to a park's history in DB.
+
+        The history is a sorted set scored by sample time. Samples older
+        than `retention` seconds are dropped in the same transaction.
+
+        Parameters
+        ----------
+        park_id : str
+            ID of park.
+        timestamp : float
+            Unix timestamp of the sample.
+        data : dict
+            Posted wait minutes keyed by experience ID.
+        retention : float
+            Seconds samples are kept.
+
+        """
+
+        db_key = f"{park_id}:history"
+        sample = json.dumps({"t": timestamp, "waits": data}, sort_keys=True)
+        pipe = self.r.pipeline(transaction=True)
+        pipe.zadd(db_key, {sample: timestamp})
+        pipe.zremrangebyscore(db_key, "-inf", f"({timestamp - retention}")
         pipe.execute()
 
     def write_park_data(self, *, park_id, data):
         """Write updated park schedule to DB.
 
+        The time of the update is recorded in the 'parks:updated' hash.
+
         Parameters
         ----------
         park_id : str
@@ -137,4 +872,7 @@ class DBClient:
 
         """
 
-        self.r.hset("parks", park_id, json.dumps(data, sort_keys=True))
+        pipe = self.r.pipeline(transaction=True)
+        pipe.hset("parks", park_id, json.dumps(data, sort_keys=True))
+        pipe.hset("parks:updated", park_id, time.time())
+        pipe.execute()
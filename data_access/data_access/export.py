@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+data_access.export
+------------------
+This module implements generators used by the themepark-times-API
+project to stream bulk exports of experiences and posted wait history
+as NDJSON or CSV.
+
+Redis is read incrementally with SCAN cursors and output is produced in
+chunks, so memory use doesn't grow with the size of the dataset.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+import csv
+import io
+import json
+
+FORMATS = ("ndjson", "csv")
+
+CSV_FIELDS = [
+    "record",
+    "parkId",
+    "id",
+    "name",
+    "type",
+    "status",
+    "postedWaitMinutes",
+    "time",
+]
+
+# Output is yielded once the buffer holds at least this many characters.
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_records(DB, *, include_history=True):
+    """Iterate over flat records of every park's experiences and history.
+
+    Parameters
+    ----------
+    DB : data_access.DBClient
+    include_history : bool, optional
+        Include posted wait history samples.
+
+    Yields
+    ------
+    dict
+        Record with the keys in `CSV_FIELDS`. 'record' is "experience"
+        for current data or "history" for history samples, and 'time'
+        is the Unix timestamp of the data.
+
+    """
+
+    for park_id in DB.scan_park_ids():
+        updated = DB.read_update_time(dataset="experiences", park_id=park_id)
+        for _, data in DB.scan_experiences(park_id=park_id):
+            experience = json.loads(data)
+            status_info = experience.get("statusInfo") or {}
+            yield {
+                "record": "experience",
+                "parkId": park_id,
+                "id": experience["id"],
+                "name": experience["name"],
+                "type": experience["type"],
+                "status": status_info.get("status"),
+                "postedWaitMinutes": status_info.get("postedWaitMinutes"),
+                "time": float(updated) if updated else None,
+            }
+        if not include_history:
+            continue
+        for data in DB.scan_history(park_id=park_id):
+            sample = json.loads(data)
+            for experience_id, minutes in sample["waits"].items():
+                yield {
+                    "record": "history",
+                    "parkId": park_id,
+                    "id": experience_id,
+                    "name": None,
+                    "type": None,
+                    "status": None,
+                    "postedWaitMinutes": minutes,
+                    "time": sample["t"],
+                }
+
+
+def _chunked(records, write, buffer):
+    """Write records to a buffer, yielding its contents in chunks."""
+
+    for record in records:
+        write(record)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def to_ndjson(records):
+    """Encode records as newline delimited JSON, yielding chunks of text."""
+
+    buffer = io.StringIO()
+
+    def write(record):
+        buffer.write(json.dumps(record, sort_keys=True))
+        buffer.write("\n")
+
+    return _chunked(records, write, buffer)
+
+
+def to_csv(records):
+    """Encode records as CSV with a header row, yielding chunks of text."""
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    return _chunked(records, writer.writerow, buffer)
+
+
+def export(DB, *, fmt="ndjson", include_history=True):
+    """Stream a bulk export of all parks.
+
+    Parameters
+    ----------
+    DB : data_access.DBClient
+    fmt : {"ndjson", "csv"}, optional
+        Output format.
+    include_history : bool, optional
+        Include posted wait history samples.
+
+    Returns
+    -------
+    generator of str
+        Chunks of the encoded export.
+
+    """
+
+    records = iter_records(DB, include_history=include_history)
+    if fmt == "csv":
+        return to_csv(records)
+    return to_ndjson(records)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+data_access.single_flight
+-------------------------
+This module implements `SingleFlight` used by the themepark-times-API
+project to coalesce concurrent identical reads within a process.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+import threading
+
+
+class _Call:
+    """An in-flight call and its outcome."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls sharing a key into one execution.
+
+    Callers arriving while a call for the same key is in flight block
+    until it finishes and share its result, or its exception. Results
+    are not kept once the call completes.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Call `fn`, unless a call for `key` is already in flight.
+
+        Parameters
+        ----------
+        key : hashable
+            Identifies calls that are interchangeable.
+        fn : callable
+            Called without arguments to produce the result.
+
+        Returns
+        -------
+        object
+            Result of the single call to `fn`, shared by all callers.
+
+        """
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Fixtures for the data_access tests.
+
+Tests using the `db` fixture run against a throwaway redis-server, as
+the Lua scripts need cjson, and are skipped if it isn't installed.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+import shutil
+import socket
+import subprocess
+import time
+
+import pytest
+import redis
+
+from data_access import db_client, DBClient
+
+PASSWORD = "test-password"
+
+
+@pytest.fixture(scope="session")
+def redis_server(tmp_path_factory):
+    """Start a redis-server on a free port, yield its (host, port)."""
+
+    executable = shutil.which("redis-server")
+    if executable is None:
+        pytest.skip("redis-server is not installed")
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen(
+        [
+            executable,
+            "--port",
+            str(port),
+            "--requirepass",
+            PASSWORD,
+            "--save",
+            "",
+            "--dir",
+            str(tmp_path_factory.mktemp("redis")),
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    client = redis.Redis(port=port, password=PASSWORD)
+    for _ in range(100):
+        try:
+            client.ping()
+            break
+        except redis.ConnectionError:
+            time.sleep(0.05)
+    yield "localhost", port
+    process.terminate()
+    process.wait()
+
+
+@pytest.fixture
+def db(redis_server, monkeypatch):
+    """DBClient connected to an empty database, without replicas."""
+
+    monkeypatch.setenv("REDIS_PASSWORD", PASSWORD)
+    monkeypatch.setattr(db_client, "_replica_retry_at", {})
+    monkeypatch.setattr(db_client, "_replica_checks", {})
+    with DBClient(primary=redis_server, replicas=[], sentinels=[]) as DB:
+        DB.r.flushall()
+        yield DB
@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+"""Tests for the data_access.db_client module.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+import json
+import threading
+import time
+from unittest import mock
+
+import redis
+
+from data_access import db_client, DBClient
+
+
+def test_read_coalesced_stores_result(db):
+    """Calls `fetch` once and serves its stored result afterwards."""
+
+    fetch = mock.Mock(return_value=[{"id": "1"}])
+
+    assert db.read_coalesced(key="k", fetch=fetch) == [{"id": "1"}]
+    assert db.read_coalesced(key="k", fetch=fetch) == [{"id": "1"}]
+    fetch.assert_called_once_with()
+    assert json.loads(db.r.get("flight:k:result")) == [{"id": "1"}]
+
+
+def test_read_coalesced_waits_for_lock_holder(db):
+    """Waits for the result of the caller holding the lock."""
+
+    db.r.set("flight:k:lock", 1, px=1000)
+    timer = threading.Timer(0.05, db.r.set, args=("flight:k:result", "[1]"))
+    timer.start()
+    fetch = mock.Mock()
+
+    assert db.read_coalesced(key="k", fetch=fetch) == [1]
+    timer.join()
+    fetch.assert_not_called()
+
+
+def test_read_coalesced_fetches_when_lock_expires(db):
+    """Calls `fetch` itself if no result shows up before the lock expires."""
+
+    db.r.set("flight:k:lock", 1, px=100)
+    fetch = mock.Mock(return_value=[2])
+
+    assert db.read_coalesced(key="k", fetch=fetch, lock_timeout=0.1) == [2]
+    fetch.assert_called_once_with()
+
+
+def test_read_coalesced_reads_result_from_replica(db):
+    """Reads the result key from a replica, leaving the primary alone."""
+
+    replica = mock.Mock()
+    replica.get.return_value = "[3]"
+    db.replicas = [("replica", replica)]
+    fetch = mock.Mock()
+
+    with mock.patch.object(db, "_replica_is_current", return_value=True):
+        with mock.patch.object(db.r, "get") as mock_primary_get:
+            assert db.read_coalesced(key="k", fetch=fetch) == [3]
+
+    replica.get.assert_called_once_with("flight:k:result")
+    mock_primary_get.assert_not_called()
+    fetch.assert_not_called()
+
+
+EXPERIENCES = {
+    "1": {
+        "id": "1",
+        "name": "Space Mountain",
+        "type": "Attraction",
+        "statusInfo": {"status": "Operating", "postedWaitMinutes": 45},
+    },
+    "2": {
+        "id": "2",
+        "name": "Jungle Cruise",
+        "type": "Attraction",
+        "statusInfo": {"status": "Down", "postedWaitMinutes": None},
+    },
+    "3": {
+        "id": "3",
+        "name": "Main Street Parade",
+        "type": "Entertainment",
+        "statusInfo": None,
+    },
+}
+
+
+def _ids(experience_data):
+    return sorted(json.loads(data)["id"] for data in experience_data)
+
+
+def test_read_experiences_filtered_without_filters(db):
+    """Returns all experiences unchanged."""
+
+    db.write_experience_data(park_id="p", data=EXPERIENCES)
+
+    experience_data = db.read_experiences_filtered(park_id="p")
+
+    assert sorted(experience_data) == sorted(
+        json.dumps(e, sort_keys=True) for e in EXPERIENCES.values()
+    )
+
+
+def test_read_experiences_filtered_by_type(db):
+    """Matches type case-insensitively."""
+
+    db.write_experience_data(park_id="p", data=EXPERIENCES)
+
+    assert _ids(db.read_experiences_filtered(park_id="p", _type="attraction")) == [
+        "1",
+        "2",
+    ]
+    assert db.read_experiences_filtered(park_id="p", _type="Dining") == []
+
+
+def test_read_experiences_filtered_by_status(db):
+    """Matches status case-insensitively, skipping experiences without one."""
+
+    db.write_experience_data(park_id="p", data=EXPERIENCES)
+
+    assert _ids(db.read_experiences_filtered(park_id="p", status="DOWN")) == ["2"]
+    assert (
+        db.read_experiences_filtered(
+            park_id="p", _type="Entertainment", status="Operating"
+        )
+        == []
+    )
+
+
+def test_read_experiences_filtered_projects_fields(db):
+    """Returns only the requested fields of matches."""
+
+    db.write_experience_data(park_id="p", data=EXPERIENCES)
+
+    experience_data = db.read_experiences_filtered(
+        park_id="p", status="operating", fields=("id", "name")
+    )
+
+    assert [json.loads(data) for data in experience_data] == [
+        {"id": "1", "name": "Space Mountain"}
+    ]
+
+
+def test_read_experiences_filtered_missing_park(db):
+    """Returns None if the park is not found."""
+
+    assert db.read_experiences_filtered(park_id="missing", _type="attraction") is None
+
+
+def test_read_experience_fields(db):
+    """Returns only the requested fields of one experience."""
+
+    db.write_experience_data(park_id="p", data=EXPERIENCES)
+
+    experience_data = db.read_experience_fields(
+        park_id="p", experience_id="1", fields=("name", "statusInfo")
+    )
+
+    assert json.loads(experience_data) == {
+        "name": "Space Mountain",
+        "statusInfo": {"status": "Operating", "postedWaitMinutes": 45},
+    }
+
+
+def test_read_experience_fields_missing_experience(db):
+    """Returns None if the park or experience is not found."""
+
+    db.write_experience_data(park_id="p", data=EXPERIENCES)
+
+    assert (
+        db.read_experience_fields(park_id="p", experience_id="9", fields=("id",))
+        is None
+    )
+    assert (
+        db.read_experience_fields(park_id="q", experience_id="1", fields=("id",))
+        is None
+    )
+
+
+def _experience(experience_id, _type, wait):
+    return {
+        "id": experience_id,
+        "name": f"Experience {experience_id}",
+        "type": _type,
+        "statusInfo": {"status": "Operating", "postedWaitMinutes": wait},
+    }
+
+
+def test_write_experience_data_maintains_wait_sets(db):
+    """Ranks experiences with a posted wait per park, type and resort."""
+
+    db.write_experience_data(park_id="p", data=EXPERIENCES)
+    db.write_experience_data(
+        park_id="q",
+        data={"7": _experience("7", "Attraction", 10)},
+    )
+
+    assert db.r.zrange("p:waits", 0, -1, withscores=True) == [("1", 45.0)]
+    assert db.r.zrange("p:waits:type:attraction", 0, -1) == ["1"]
+    assert db.r.smembers("p:waits:types") == {"attraction"}
+    assert db.r.zrange("waits", 0, -1, withscores=True) == [
+        ("q:7", 10.0),
+        ("p:1", 45.0),
+    ]
+    assert db.r.zrange("waits:type:attraction", 0, -1) == ["q:7", "p:1"]
+
+
+def test_write_experience_data_replaces_park_wait_sets(db):
+    """Drops the park's old members, leaving other parks in place."""
+
+    db.write_experience_data(
+        park_id="p",
+        data={
+            "1": _experience("1", "Attraction", 45),
+            "2": _experience("2", "Entertainment", 20),
+        },
+    )
+    db.write_experience_data(park_id="q", data={"1": _experience("1", "Attraction", 5)})
+    db.write_experience_data(
+        park_id="p",
+        data={
+            "1": _experience("1", "Entertainment", 30),
+            "3": _experience("3", "Attraction", 60),
+        },
+    )
+
+    assert db.r.zrange("p:waits", 0, -1) == ["1", "3"]
+    assert db.r.zrange("p:waits:type:entertainment", 0, -1) == ["1"]
+    assert db.r.zrange("p:waits:type:attraction", 0, -1) == ["3"]
+    assert db.r.zrange("waits", 0, -1, withscores=True) == [
+        ("q:1", 5.0),
+        ("p:1", 30.0),
+        ("p:3", 60.0),
+    ]
+    assert db.r.zrange("waits:type:attraction", 0, -1) == ["q:1", "p:3"]
+    assert db.r.zrange("waits:type:entertainment", 0, -1) == ["p:1"]
+
+
+def test_read_top_waits(db):
+    """Returns a park's experiences ordered by posted wait."""
+
+    db.write_experience_data(
+        park_id="p",
+        data={
+            "1": _experience("1", "Attraction", 45),
+            "2": _experience("2", "Attraction", 20),
+            "3": _experience("3", "Entertainment", 30),
+        },
+    )
+
+    assert _ids(db.read_top_waits(park_id="p", limit=2)) == ["2", "3"]
+    assert [
+        json.loads(data)["id"]
+        for data in db.read_top_waits(park_id="p", _type="Attraction", order="desc")
+    ] == ["1", "2"]
+    assert db.read_top_waits(park_id="missing") is None
+
+
+def test_read_resort_top_waits(db):
+    """Returns experiences in all parks ordered by posted wait."""
+
+    db.write_experience_data(
+        park_id="p", data={"1": _experience("1", "Attraction", 45)}
+    )
+    db.write_experience_data(
+        park_id="q",
+        data={
+            "1": _experience("1", "Attraction", 10),
+            "2": _experience("2", "Entertainment", 60),
+        },
+    )
+
+    top = db.read_resort_top_waits(order="desc", limit=2)
+    assert [(park_id, json.loads(data)["id"]) for park_id, data in top] == [
+        ("q", "2"),
+        ("p", "1"),
+    ]
+    top = db.read_resort_top_waits(_type="ATTRACTION")
+    assert [(park_id, json.loads(data)["id"]) for park_id, data in top] == [
+        ("q", "1"),
+        ("p", "1"),
+    ]
+    assert db.read_resort_top_waits(_type="dining") == []
+
+
+def _change(experience_id):
+    return {"change": "added", "id": experience_id, "status": None}
+
+
+def test_write_experience_data_records_trimmed_changes(db, monkeypatch):
+    """Keeps CHANGES_MAXLEN events and the ID of the newest one dropped."""
+
+    monkeypatch.setattr("data_access.db_client.CHANGES_MAXLEN", 3)
+    db.write_experience_data(park_id="p", data={}, changes=[_change("1")])
+    db.write_experience_data(park_id="p", data={}, changes=[_change("2")])
+
+    entries, trimmed = db.read_changes(park_id="p")
+    assert [json.loads(data)["id"] for _, data in entries] == ["1", "2"]
+    assert trimmed is None
+    last_dropped = entries[-1][0]
+
+    db.write_experience_data(
+        park_id="p", data={}, changes=[_change("3"), _change("4"), _change("5")]
+    )
+
+    entries, trimmed = db.read_changes(park_id="p")
+    assert [json.loads(data)["id"] for _, data in entries] == ["3", "4", "5"]
+    assert trimmed == last_dropped
+
+
+def test_read_changes_since_cursor(db):
+    """Returns only the events after `since`, up to `count`."""
+
+    db.write_experience_data(
+        park_id="p", data={}, changes=[_change("1"), _change("2"), _change("3")]
+    )
+    cursors = [stream_id for stream_id, _ in db.read_changes(park_id="p")[0]]
+
+    entries, _ = db.read_changes(park_id="p", since=cursors[0], count=1)
+
+    assert [stream_id for stream_id, _ in entries] == [cursors[1]]
+
+
+def _replica(lag=0, link="up"):
+    """Mock replica reporting the given replication status."""
+
+    replica = mock.Mock()
+    replica.info.return_value = {
+        "master_link_status": link,
+        "master_last_io_seconds_ago": lag,
+    }
+    return replica
+
+
+def test_read_pins_one_replica(db):
+    """Sends all reads of an instance to the same replica."""
+
+    replicas = [_replica(), _replica()]
+    db.replicas = [("a", replicas[0]), ("b", replicas[1])]
+
+    db.read_update_time(dataset="experiences", park_id="p")
+    db.read_experiences(park_id="p")
+
+    used = [replica for replica in replicas if replica.hget.called]
+    assert len(used) == 1
+    used[0].hgetall.assert_called_once_with("p:experiences")
+
+
+def test_read_skips_stale_replicas(db):
+    """Reads from the primary if replicas lag or lost the primary."""
+
+    stale, unlinked = _replica(lag=31), _replica(link="down")
+    db.replicas = [("stale", stale), ("unlinked", unlinked)]
+    db.write_park_data(park_id="p", data={"id": "p"})
+
+    assert json.loads(db.read_park("p")) == {"id": "p"}
+    stale.hget.assert_not_called()
+    unlinked.hget.assert_not_called()
+
+
+def test_read_caches_replica_checks(db, redis_server):
+    """Checks a replica's status once per REPLICA_CHECK_INTERVAL."""
+
+    replica = _replica()
+    db.replicas = [("a", replica)]
+    db.read_parks()
+    other = DBClient(primary=redis_server, replicas=[], sentinels=[])
+    other.replicas = [("a", replica)]
+    other.read_parks()
+
+    replica.info.assert_called_once_with("replication")
+    assert replica.hgetall.call_count == 2
+
+
+def test_read_falls_back_to_primary(db, redis_server):
+    """Moves to the primary if the replica fails, and skips it for a while."""
+
+    replica = _replica()
+    replica.hget.side_effect = redis.ConnectionError
+    db.replicas = [("a", replica)]
+    db.write_park_data(park_id="p", data={"id": "p"})
+
+    assert json.loads(db.read_park("p")) == {"id": "p"}
+    db.read_parks()
+    replica.hgetall.assert_not_called()
+
+    other = DBClient(primary=redis_server, replicas=[], sentinels=[])
+    other.replicas = [("a", replica)]
+    other.read_parks()
+    replica.hgetall.assert_not_called()
+    assert db_client._replica_retry_at["a"] > time.monotonic()
+
+
+def test_read_skips_unreachable_replica(db):
+    """Reads from the primary if a replica doesn't respond to checks."""
+
+    replica = _replica()
+    replica.info.side_effect = redis.TimeoutError
+    db.replicas = [("a", replica)]
+
+    assert db.read_parks() == {}
+    assert "a" in db_client._replica_retry_at
+
+
+def test_read_from_primary(db, redis_server):
+    """Never reads from replicas if `read_from_primary` is set."""
+
+    replica = _replica()
+    with DBClient(
+        primary=redis_server, replicas=[], sentinels=[], read_from_primary=True
+    ) as DB:
+        DB.replicas = [("a", replica)]
+        DB.read_parks()
+
+    replica.info.assert_not_called()
+    replica.hgetall.assert_not_called()
+
+
+@mock.patch("data_access.db_client.Sentinel")
+def test_sentinel_replicas_are_checked_one_by_one(mock_Sentinel, monkeypatch):
+    """Connects to each replica Sentinel reports, reusing the discovery."""
+
+    monkeypatch.setenv("REDIS_PASSWORD", "password")
+    monkeypatch.setattr(db_client, "_sentinel_replicas", {})
+    sentinel = mock_Sentinel.return_value
+    sentinel.discover_slaves.return_value = [("10.0.0.1", 6379), ("10.0.0.2", 6379)]
+
+    DB = DBClient(sentinels=[("sentinel", 26379)])
+    DBClient(sentinels=[("sentinel", 26379)])
+
+    assert [name for name, _ in DB.replicas] == ["10.0.0.1:6379", "10.0.0.2:6379"]
+    assert DB.r is sentinel.master_for.return_value
+    sentinel.discover_slaves.assert_called_once_with("mymaster")
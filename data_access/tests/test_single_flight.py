@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Tests for the data_access.single_flight module.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+import threading
+import time
+
+import pytest
+
+from data_access import SingleFlight
+
+
+def _run_concurrently(flight, fn, callers=5):
+    """Call `flight.do` from several threads while the first call is held.
+
+    Returns the results, or exceptions, of all callers.
+    """
+
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def held():
+        started.set()
+        release.wait()
+        return fn()
+
+    def call(target):
+        try:
+            results.append(flight.do("key", target))
+        except Exception as e:
+            results.append(e)
+
+    leader = threading.Thread(target=call, args=(held,))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=call, args=(fn,)) for _ in range(callers - 1)]
+    for follower in followers:
+        follower.start()
+    # Give the followers time to join the call in flight.
+    time.sleep(0.1)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join()
+    return results
+
+
+def test_do_shares_result_of_concurrent_calls():
+    """Calls `fn` once for concurrent callers with the same key."""
+
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return {"value": 1}
+
+    results = _run_concurrently(SingleFlight(), fn)
+
+    assert len(calls) == 1
+    assert results == [{"value": 1}] * 5
+
+
+def test_do_shares_exception_of_concurrent_calls():
+    """Raises the exception of the call in flight in all callers."""
+
+    error = ValueError("fetch failed")
+
+    def fn():
+        raise error
+
+    results = _run_concurrently(SingleFlight(), fn)
+
+    assert results == [error] * 5
+
+
+def test_do_doesnt_keep_results():
+    """Calls `fn` again once the previous call has completed."""
+
+    flight = SingleFlight()
+
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: int("a"))
+    assert flight.do("key", lambda: 3) == 3
+
+
+def test_do_doesnt_share_across_keys():
+    """Calls with different keys don't wait on each other."""
+
+    flight = SingleFlight()
+
+    assert flight.do("a", lambda: flight.do("b", lambda: "b") + "a") == "ba"
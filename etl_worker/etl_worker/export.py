@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+etl_worker.export
+-----------------
+This module implements a command line entry point to stream a bulk
+export of all parks' experiences and posted wait history from Redis as
+NDJSON or CSV, using `data_access.export`.
+
+Usage: python -m etl_worker.export [--format {ndjson,csv}] [--no-history]
+[--output FILE]
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+import argparse
+import sys
+
+from data_access import DBClient
+from data_access.export import FORMATS, export
+
+
+def main(argv=None):
+    """Write an export to a file or stdout.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Command line arguments, `sys.argv[1:]` if None.
+
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Export all experiences and posted wait history."
+    )
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument(
+        "--no-history", action="store_true", help="skip posted wait history"
+    )
+    parser.add_argument("-o", "--output", help="file to write, stdout by default")
+    args = parser.parse_args(argv)
+
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        with DBClient() as DB:
+            for chunk in export(
+                DB, fmt=args.format, include_history=not args.no_history
+            ):
+                output.write(chunk)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
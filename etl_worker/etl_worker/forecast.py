@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+etl_worker.forecast
+-------------------
+This module implements short-horizon forecasts of posted wait times,
+fitted for all experiences in a park at once with NumPy.
+
+Each experience's waits are modelled as a level plus a seasonal
+deviation for the hour of the week (in UTC). The seasonal profile is the
+mean deviation from the experience's overall mean in each hour of the
+week, and the level is an exponentially weighted mean of the
+deseasonalized waits, weighting recent samples the most.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+from datetime import datetime, timezone
+
+import numpy as np
+
+HOURS_PER_WEEK = 7 * 24
+
+
+def _hour_of_week(timestamps):
+    """Map Unix timestamps to hours of the week, Monday 00:00 UTC being 0."""
+
+    hours = np.floor_divide(np.asarray(timestamps, dtype=float), 3600).astype(int)
+    # 1970-01-01 was a Thursday, i.e. day 3 of the week.
+    return ((hours // 24 + 3) % 7) * 24 + hours % 24
+
+
+def fit(timestamps, waits, *, halflife=1800.0):
+    """Fit levels and seasonal profiles for a set of experiences.
+
+    Parameters
+    ----------
+    timestamps : array of shape (samples,)
+        Unix timestamps of the samples, oldest first.
+    waits : array of shape (samples, experiences)
+        Posted wait minutes, NaN where missing.
+    halflife : float, optional
+        Age in seconds at which a sample's weight in the level halves.
+
+    Returns
+    -------
+    level : array of shape (experiences,)
+        Deseasonalized level, NaN for experiences without samples.
+    profile : array of shape (168, experiences)
+        Deviation from the level in each hour of the week.
+
+    """
+
+    timestamps = np.asarray(timestamps, dtype=float)
+    waits = np.asarray(waits, dtype=float)
+    observed = ~np.isnan(waits)
+    hours = _hour_of_week(timestamps)
+
+    counts = observed.sum(axis=0)
+    mean = np.divide(
+        np.where(observed, waits, 0).sum(axis=0),
+        counts,
+        out=np.zeros(waits.shape[1]),
+        where=counts > 0,
+    )
+    deviations = np.where(observed, waits - mean, 0)
+    sums = np.zeros((HOURS_PER_WEEK, waits.shape[1]))
+    hour_counts = np.zeros((HOURS_PER_WEEK, waits.shape[1]))
+    np.add.at(sums, hours, deviations)
+    np.add.at(hour_counts, hours, observed)
+    profile = np.divide(
+        sums, hour_counts, out=np.zeros_like(sums), where=hour_counts > 0
+    )
+
+    deseasonalized = np.where(observed, waits - profile[hours], 0)
+    age = timestamps[-1] - timestamps
+    weights = np.where(observed, (0.5 ** (age / halflife))[:, np.newaxis], 0)
+    total_weight = weights.sum(axis=0)
+    level = np.divide(
+        (weights * deseasonalized).sum(axis=0),
+        total_weight,
+        out=np.full(waits.shape[1], np.nan),
+        where=total_weight > 0,
+    )
+    return level, profile
+
+
+def predict(level, profile, timestamps):
+    """Forecast posted waits at the given times.
+
+    Parameters
+    ----------
+    level : array of shape (experiences,)
+    profile : array of shape (168, experiences)
+    timestamps : array of shape (targets,)
+        Unix timestamps to forecast for.
+
+    Returns
+    -------
+    array of shape (targets, experiences)
+        Forecast wait minutes, never negative.
+
+    """
+
+    return np.clip(level + profile[_hour_of_week(timestamps)], 0, None)
+
+
+def forecast_waits(*, samples, now, horizons, halflife=1800.0):
+    """Forecast posted waits for the experiences in the latest sample.
+
+    Parameters
+    ----------
+    samples : list of dicts
+        History samples, oldest first, with a 't' Unix timestamp and
+        'waits' mapping experience IDs to posted wait minutes.
+    now : float
+        Unix timestamp the horizons are counted from.
+    horizons : list of int
+        Minutes ahead to forecast.
+    halflife : float, optional
+        See `fit`.
+
+    Returns
+    -------
+    dict of dicts
+        Forecasts keyed by experience ID.
+
+    """
+
+    if not samples or not samples[-1]["waits"]:
+        return {}
+    experience_ids = sorted(samples[-1]["waits"])
+    columns = {experience_id: i for i, experience_id in enumerate(experience_ids)}
+    timestamps = np.array([sample["t"] for sample in samples], dtype=float)
+    waits = np.full((len(samples), len(experience_ids)), np.nan)
+    for row, sample in enumerate(samples):
+        for experience_id, minutes in sample["waits"].items():
+            column = columns.get(experience_id)
+            if column is not None:
+                waits[row, column] = minutes
+
+    level, profile = fit(timestamps, waits, halflife=halflife)
+    predicted = predict(level, profile, now + 60 * np.asarray(horizons))
+    generated_at = datetime.fromtimestamp(now, timezone.utc).isoformat()
+    return {
+        experience_id: {
+            "id": experience_id,
+            "generatedAt": generated_at,
+            "forecasts": [
+                {"minutes": minutes, "postedWaitMinutes": int(round(wait))}
+                for minutes, wait in zip(horizons, predicted[:, column])
+            ],
+        }
+        for column, experience_id in enumerate(experience_ids)
+    }
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+etl_worker.profiling
+--------------------
+This module implements opt-in profiling of update cycles with cProfile.
+
+Profiling is off unless the PROFILE_DIR environment variable is set, in
+which case cycles are profiled at random at PROFILE_SAMPLE_RATE. Each
+profile is written to PROFILE_DIR as <name>-<trace ID>.prof.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+import contextlib
+import cProfile
+import logging
+import os
+import random
+import uuid
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+
+
+@contextlib.contextmanager
+def profiled(name):
+    """Profile the enclosed block, if profiling is enabled and sampled.
+
+    Parameters
+    ----------
+    name : str
+        Prefix of the profile file name.
+
+    """
+
+    if not PROFILE_DIR or random.random() >= PROFILE_SAMPLE_RATE:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{name}-{uuid.uuid4().hex}.prof")
+        profiler.dump_stats(path)
+        logger.info("Wrote profile to %s", path)
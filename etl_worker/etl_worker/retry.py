@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+etl_worker.retry
+----------------
+This module implements rate limiting, retries with backoff and circuit
+breaking for requests made by `etl_worker.tasks` to upstream APIs.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+import contextlib
+import email.utils
+import random
+import threading
+import time
+
+import requests
+
+# Actions taken on a response status code.
+RETRY = "retry"  # Back off and try again.
+REAUTH = "reauth"  # Refresh credentials and try again right away.
+FAIL = "fail"  # Give up.
+
+STATUS_POLICIES = {
+    401: REAUTH,
+    408: RETRY,
+    429: RETRY,
+    500: RETRY,
+    502: RETRY,
+    503: RETRY,
+    504: RETRY,
+}
+
+
+class RetryError(Exception):
+    """Raised when a request doesn't get a successful response."""
+
+
+class CircuitOpenError(RetryError):
+    """Raised when requests to an endpoint are blocked after failures."""
+
+
+class DeadlineExceededError(RetryError):
+    """Raised when a request can't complete before the deadline."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting the rate of requests.
+
+    Parameters
+    ----------
+    rate : float
+        Tokens added per second.
+    capacity : int
+        Maximum number of tokens, i.e. the allowed burst of requests.
+
+    """
+
+    def __init__(self, *, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token, returning the seconds to wait before using it."""
+
+        with self._lock:
+            now = self._clock()
+            elapsed = now - self._updated
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self, *, deadline=None):
+        """Block until a token is available.
+
+        Parameters
+        ----------
+        deadline : float, optional
+            Clock time by which the token must be available.
+
+        Returns
+        -------
+        bool
+            False, without taking a token, if the deadline would pass.
+
+        """
+
+        wait = self._reserve()
+        if deadline is not None and self._clock() + wait > deadline:
+            with self._lock:
+                self._tokens += 1
+            return False
+        if wait:
+            self._sleep(wait)
+        return True
+
+
+class CircuitBreaker:
+    """Blocks calls to an endpoint after consecutive failures.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls are refused for `reset_timeout` seconds. Then a single trial
+    call is let through, closing the circuit on success and opening it
+    again on failure.
+
+    """
+
+    def __init__(
+        self, *, failure_threshold=5, reset_timeout=60.0, clock=time.monotonic
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may be made."""
+
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or self._clock() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        """Close the circuit."""
+
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        """Count a failure, opening the circuit at the threshold."""
+
+        with self._lock:
+            self._failures += 1
+            self._trial = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+
+
+class RetryEngine:
+    """Makes requests with rate limiting, retries and circuit breaking.
+
+    All requests share one token bucket, while circuit breakers are kept
+    per endpoint. Failed requests are retried with exponential backoff
+    and full jitter, honoring 'Retry-After' headers, for as long as the
+    deadline set with `deadline` allows. A request fails right away if
+    'Retry-After' asks for a longer wait than `max_delay`.
+
+    Parameters
+    ----------
+    rate : float, optional
+        Requests per second allowed on average.
+    burst : int, optional
+        Requests allowed in a burst.
+    max_attempts : int, optional
+        Attempts made per request.
+    base_delay : float, optional
+        Upper bound of the first backoff delay in seconds.
+    max_delay : float, optional
+        Upper bound of any backoff delay or 'Retry-After' wait in seconds.
+    status_policies : dict, optional
+        Maps status codes to RETRY, REAUTH or FAIL. Unlisted 5xx codes
+        are retried and other unlisted codes fail.
+    failure_threshold : int, optional
+        Consecutive failures opening an endpoint's circuit.
+    reset_timeout : float, optional
+        Seconds an endpoint's circuit stays open.
+
+    """
+
+    def __init__(
+        self,
+        *,
+        rate=5.0,
+        burst=10,
+        max_attempts=5,
+        base_delay=0.1,
+        max_delay=10.0,
+        status_policies=STATUS_POLICIES,
+        failure_threshold=5,
+        reset_timeout=60.0,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.bucket = TokenBucket(rate=rate, capacity=burst, clock=clock, sleep=sleep)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.status_policies = status_policies
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._sleep = sleep
+        self._deadline = None
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def deadline(self, seconds):
+        """Limit the time spent on requests made within the context.
+
+        Parameters
+        ----------
+        seconds : float or None
+            Time budget, no limit if None.
+
+        """
+
+        previous = self._deadline
+        self._deadline = None if seconds is None else self._clock() + seconds
+        try:
+            yield
+        finally:
+            self._deadline = previous
+
+    def _breaker(self, endpoint):
+        """Get the circuit breaker for `endpoint`, creating it if needed."""
+
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker(
+                    failure_threshold=self.failure_threshold,
+                    reset_timeout=self.reset_timeout,
+                    clock=self._clock,
+                )
+            return self._breakers[endpoint]
+
+    def _backoff(self, attempt):
+        """Full jitter delay before retrying after `attempt` attempts."""
+
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _retry_after(self, response):
+        """Seconds to wait according to a 'Retry-After' header, if any."""
+
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        if value.isdigit():
+            return float(value)
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, retry_at.timestamp() - time.time())
+
+    def request(self, send, *, endpoint, on_reauth=None):
+        """Make a request, retrying according to the configured policies.
+
+        Parameters
+        ----------
+        send : callable
+            Called without arguments to make one attempt, returns a
+            `requests.Response`.
+        endpoint : str
+            Identifies the endpoint for circuit breaking.
+        on_reauth : callable, optional
+            Called before retrying a response with a REAUTH policy.
+
+        Returns
+        -------
+        requests.Response
+            Response with a 2xx status code.
+
+        Raises
+        ------
+        RetryError
+            If no successful response is received.
+
+        """
+
+        breaker = self._breaker(endpoint)
+        for attempt in range(1, self.max_attempts + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {endpoint}.")
+            if not self.bucket.acquire(deadline=self._deadline):
+                raise DeadlineExceededError(f"Rate limit wait for {endpoint}.")
+            try:
+                response = send()
+            except requests.RequestException as e:
+                breaker.record_failure()
+                delay = self._backoff(attempt)
+                reason = repr(e)
+            except Exception:
+                # Any outcome must be recorded, or a half-open circuit
+                # would wait for its trial call forever.
+                breaker.record_failure()
+                raise
+            else:
+                status = response.status_code
+                if 200 <= status < 300:
+                    breaker.record_success()
+                    return response
+                policy = self.status_policies.get(
+                    status, RETRY if status >= 500 else FAIL
+                )
+                reason = f"status {status}"
+                if policy == FAIL:
+                    breaker.record_success()
+                    raise RetryError(f"Request to {endpoint} failed with {reason}.")
+                elif policy == REAUTH:
+                    breaker.record_success()
+                    if on_reauth is not None:
+                        on_reauth()
+                    delay = 0.0
+                else:
+                    breaker.record_failure()
+                    delay = self._retry_after(response)
+                    if delay is None:
+                        delay = self._backoff(attempt)
+                    elif delay > self.max_delay:
+                        raise RetryError(
+                            f"Request to {endpoint} failed with {reason}, "
+                            f"retry asked for after {delay:.0f} s."
+                        )
+
+            if attempt == self.max_attempts:
+                break
+            if self._deadline is not None and self._clock() + delay > self._deadline:
+                raise DeadlineExceededError(
+                    f"Retry of {endpoint} after {reason} would pass the deadline."
+                )
+            if delay:
+                self._sleep(delay)
+
+        raise RetryError(
+            f"Request to {endpoint} failed after {self.max_attempts} attempts, "
+            f"last with {reason}."
+        )
@@ -13,33 +13,42 @@ license: MIT, see LICENSE for more details.
 
 """
 
+import logging
 import os
 import sched
 import time
 
-from etl_worker import tasks
+from etl_worker import profiling, tasks
 
 UPDATE_FREQ_SCHEDULES = int(os.environ.get("UPDATE_FREQ_SCHEDULES", 3600))
 UPDATE_FREQ_EXPERIENCES = int(os.environ.get("UPDATE_FREQ_EXPERIENCES", 60))
 
+# Tasks run on one thread, so park updates mustn't take longer than the
+# experiences update interval, or experiences updates would be delayed.
+PARKS_TIME_BUDGET = min(UPDATE_FREQ_SCHEDULES, UPDATE_FREQ_EXPERIENCES)
+
 
 def experiences_task():
     """Re-schedule self before executing `tasks.update_experiences`."""
 
     schedule.enter(UPDATE_FREQ_EXPERIENCES, 1, experiences_task)
-    tasks.update_experiences()
+    with profiling.profiled("experiences"):
+        tasks.update_experiences(time_budget=UPDATE_FREQ_EXPERIENCES)
 
 
 def parks_task():
     """Re-schedule self before executing `tasks.update_parks`."""
 
     schedule.enter(UPDATE_FREQ_SCHEDULES, 2, parks_task)
-    tasks.update_parks()
+    with profiling.profiled("parks"):
+        tasks.update_parks(time_budget=PARKS_TIME_BUDGET)
 
 
 if __name__ == "__main__":
-    tasks.update_parks()
-    tasks.update_experiences()
+    logging.basicConfig(level=logging.INFO)
+
+    tasks.update_parks(time_budget=PARKS_TIME_BUDGET)
+    tasks.update_experiences(time_budget=UPDATE_FREQ_EXPERIENCES)
 
     schedule = sched.scheduler(time.time, time.sleep)
     schedule.enter(UPDATE_FREQ_SCHEDULES, 2, parks_task)
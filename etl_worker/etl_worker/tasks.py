@@ -10,12 +10,35 @@ license: MIT, see LICENSE for more details.
 
 """
 
-from time import sleep
+import json
+import logging
+import os
+import time
 
 import requests
 import requests_cache
 
 from data_access import DBClient
+from etl_worker import forecast, retry
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", 10))
+
+# Posted waits are sampled into history every HISTORY_INTERVAL seconds
+# and kept for HISTORY_RETENTION seconds. Forecasts are refit whenever a
+# sample is recorded, for each horizon in FORECAST_HORIZONS (minutes).
+HISTORY_INTERVAL = int(os.environ.get("HISTORY_INTERVAL", 300))
+HISTORY_RETENTION = int(os.environ.get("HISTORY_RETENTION", 14 * 24 * 3600))
+FORECAST_HORIZONS = [
+    int(minutes) for minutes in os.environ.get("FORECAST_HORIZONS", "30,60").split(",")
+]
+
+# All upstream requests share one rate limit.
+upstream = retry.RetryEngine(
+    rate=float(os.environ.get("UPSTREAM_RATE", 5)),
+    burst=int(os.environ.get("UPSTREAM_BURST", 10)),
+)
 
 parks = {
     "80007944": {"name": "Magic Kingdom Park", "slug": "magic-kingdom"},
@@ -36,6 +59,8 @@ parks = {
 def _api_request(*, api_endpoint, query_string=""):
     """Add http headers and makes GET request to specified API endpoint.
 
+    The request is rate limited and retried through `upstream`.
+
     Parameters
     ----------
     api_endpoint : str
@@ -45,24 +70,72 @@ def _api_request(*, api_endpoint, query_string=""):
 
     Returns
     -------
-    dict
-        Decoded JSON from API response.
+    dict or None
+        Decoded JSON from API response, None if the request failed.
 
     """
 
     base_url = "https://api.wdpro.disney.go.com"
     request_url = "".join([base_url, api_endpoint, query_string])
     headers = {"Accept": "application/json;apiversion=1;charset=UTF-8"}
-    # TODO: Replace ugly retry loop.
-    for i in range(1, 6):  # Make 5 attemts to get a valid response.
+
+    def send():
         headers["Authorization"] = _fetch_access_token()
-        r = requests.get(request_url, headers=headers)
-        if r.status_code == 200:
-            return r.json()
-        elif r.status_code == 401:  # Unauthorized
-            requests_cache.core.clear()
+        return requests.get(request_url, headers=headers, timeout=REQUEST_TIMEOUT)
+
+    try:
+        r = upstream.request(
+            send,
+            endpoint=api_endpoint,
+            # Drop the cached access token, it's been rejected.
+            on_reauth=lambda: requests_cache.core.clear(),
+        )
+    except retry.RetryError as e:
+        logger.warning(e)
+        return None
+    return r.json()
+
+
+def _diff_experience_data(*, old, new):
+    """Find experiences whose status or posted wait time changed.
+
+    Parameters
+    ----------
+    old : dict of dicts
+        Previous experience data.
+    new : dict of dicts
+        Updated experience data.
+
+    Returns
+    -------
+    list of dicts
+        Change events ordered by experience ID.
+
+    """
+
+    def status(record):
+        status_info = record.get("statusInfo") or {}
+        return status_info.get("status"), status_info.get("postedWaitMinutes")
+
+    changes = []
+    for experience_id in sorted(old.keys() | new.keys()):
+        if experience_id not in new:
+            change, current = "removed", (None, None)
+        elif experience_id not in old:
+            change, current = "added", status(new[experience_id])
         else:
-            sleep((i ** 4) / 100)  # Sleeps for 0.01, 0.16, 0.81, 2.56 and 6.25 seconds.
+            change, current = "updated", status(new[experience_id])
+            if current == status(old[experience_id]):
+                continue
+        changes.append(
+            {
+                "id": experience_id,
+                "change": change,
+                "status": current[0],
+                "postedWaitMinutes": current[1],
+            }
+        )
+    return changes
 
 
 def _fetch_access_token():
@@ -139,6 +212,8 @@ def _fetch_park_data(*, park_id):
 def _load_experience_data(*, park_id, data):
     """Load experience status data into Redis.
 
+    Changes from the data currently in Redis are recorded along with it.
+
     Parameters
     ----------
     park_id : str
@@ -148,8 +223,72 @@ def _load_experience_data(*, park_id, data):
 
     """
 
-    with DBClient() as DB:
-        DB.write_experience_data(park_id=park_id, data=data)
+    with DBClient(read_from_primary=True) as DB:
+        stored_data = DB.read_experiences(park_id=park_id)
+        previous = {key: json.loads(value) for key, value in stored_data.items()}
+        changes = _diff_experience_data(old=previous, new=data)
+        DB.write_experience_data(park_id=park_id, data=data, changes=changes)
+
+
+def _load_forecasts(*, park_id, timestamp):
+    """Fit wait time forecasts on a park's history and load them into Redis.
+
+    Parameters
+    ----------
+    park_id : str
+        ID number of park.
+    timestamp : float
+        Unix timestamp the forecasts are made at.
+
+    """
+
+    with DBClient(read_from_primary=True) as DB:
+        samples = [json.loads(sample) for sample in DB.read_history(park_id=park_id)]
+        forecasts = forecast.forecast_waits(
+            samples=samples, now=timestamp, horizons=FORECAST_HORIZONS
+        )
+        DB.write_forecasts(park_id=park_id, data=forecasts)
+
+
+def _load_history_sample(*, park_id, data, timestamp):
+    """Load posted waits into the park's history in Redis.
+
+    A sample is only recorded if the latest one is at least
+    `HISTORY_INTERVAL` seconds old.
+
+    Parameters
+    ----------
+    park_id : str
+        ID number of park.
+    data : dict of dicts
+        Experience data.
+    timestamp : float
+        Unix timestamp of the sample.
+
+    Returns
+    -------
+    bool
+        True if a sample was recorded.
+
+    """
+
+    waits = {}
+    for experience_id, experience in data.items():
+        wait = (experience.get("statusInfo") or {}).get("postedWaitMinutes")
+        if wait is not None:
+            waits[experience_id] = wait
+
+    with DBClient(read_from_primary=True) as DB:
+        latest = DB.read_history_time(park_id=park_id)
+        if latest is not None and timestamp - latest < HISTORY_INTERVAL:
+            return False
+        DB.write_history_sample(
+            park_id=park_id,
+            timestamp=timestamp,
+            data=waits,
+            retention=HISTORY_RETENTION,
+        )
+    return True
 
 
 def _load_park_data(*, park_id, data):
@@ -223,25 +362,51 @@ def _process_park_data(*, data):
     return park_data
 
 
-def update_experiences():
-    """Pull new experience data and update database for all parks."""
+def update_experiences(*, time_budget=None):
+    """Pull new experience data and update database for all parks.
 
-    for park_id in parks.keys():
-        data = _fetch_experience_data(park_id=park_id)
-        if data:
-            experience_data = _process_experience_data(data=data)
-        else:
-            continue
-        _load_experience_data(park_id=park_id, data=experience_data)
+    Posted waits are also sampled into each park's history, refitting
+    the park's wait time forecasts when a sample is recorded.
+
+    Parameters
+    ----------
+    time_budget : float, optional
+        Seconds available for upstream requests, usually the time until
+        the next scheduled update.
 
+    """
 
-def update_parks():
-    """Pull new park data and update database for all parks."""
+    with upstream.deadline(time_budget):
+        for park_id in parks.keys():
+            data = _fetch_experience_data(park_id=park_id)
+            if data:
+                experience_data = _process_experience_data(data=data)
+            else:
+                continue
+            _load_experience_data(park_id=park_id, data=experience_data)
+            timestamp = time.time()
+            if _load_history_sample(
+                park_id=park_id, data=experience_data, timestamp=timestamp
+            ):
+                _load_forecasts(park_id=park_id, timestamp=timestamp)
 
-    for park_id in parks.keys():
-        data = _fetch_park_data(park_id=park_id)
-        if data:
-            park_data = _process_park_data(data=data)
-        else:
-            continue
-        _load_park_data(park_id=park_id, data=park_data)
+
+def update_parks(*, time_budget=None):
+    """Pull new park data and update database for all parks.
+
+    Parameters
+    ----------
+    time_budget : float, optional
+        Seconds available for upstream requests, usually the time until
+        the next scheduled update.
+
+    """
+
+    with upstream.deadline(time_budget):
+        for park_id in parks.keys():
+            data = _fetch_park_data(park_id=park_id)
+            if data:
+                park_data = _process_park_data(data=data)
+            else:
+                continue
+            _load_park_data(park_id=park_id, data=park_data)
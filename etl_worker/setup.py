@@ -8,6 +8,7 @@ setup(
     author_email="erberlin.dev@gmail.com",
     license="MIT",
     packages=["etl_worker"],
-    install_requires=["requests", "requests_cache"],
+    install_requires=["numpy", "requests", "requests_cache"],
     python_requires=">=3.6",
+    entry_points={"console_scripts": ["themepark-export = etl_worker.export:main"]},
 )
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Tests for the etl_worker.export module.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+import csv
+import json
+from unittest import mock
+
+from etl_worker.export import main
+
+EXPERIENCE = {
+    "id": "80010176",
+    "name": "Space Mountain",
+    "type": "Attraction",
+    "statusInfo": {"status": "Operating", "postedWaitMinutes": 45},
+}
+SAMPLE = {"t": 1560000000.0, "waits": {"80010176": 40}}
+
+
+def _mock_db():
+    """DBClient mock holding one park with one experience and sample."""
+
+    mock_db = mock.MagicMock()
+    db = mock_db.return_value.__enter__.return_value
+    db.scan_park_ids.return_value = iter(["80007944"])
+    db.read_update_time.return_value = "1560000300.0"
+    db.scan_experiences.return_value = iter(
+        [(EXPERIENCE["id"], json.dumps(EXPERIENCE))]
+    )
+    db.scan_history.return_value = iter([json.dumps(SAMPLE)])
+    return mock_db
+
+
+def test_main_writes_ndjson(tmp_path):
+    """Writes one JSON record per experience and history value."""
+
+    output = tmp_path / "export.ndjson"
+    with mock.patch("etl_worker.export.DBClient", _mock_db()):
+        main(["--output", str(output)])
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert records == [
+        {
+            "record": "experience",
+            "parkId": "80007944",
+            "id": "80010176",
+            "name": "Space Mountain",
+            "type": "Attraction",
+            "status": "Operating",
+            "postedWaitMinutes": 45,
+            "time": 1560000300.0,
+        },
+        {
+            "record": "history",
+            "parkId": "80007944",
+            "id": "80010176",
+            "name": None,
+            "type": None,
+            "status": None,
+            "postedWaitMinutes": 40,
+            "time": 1560000000.0,
+        },
+    ]
+
+
+def test_main_writes_csv_without_history(tmp_path):
+    """Writes a header and experience rows, skipping history."""
+
+    output = tmp_path / "export.csv"
+    mock_db = _mock_db()
+    with mock.patch("etl_worker.export.DBClient", mock_db):
+        main(["--format", "csv", "--no-history", "--output", str(output)])
+
+    with open(output, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 1
+    assert rows[0]["name"] == "Space Mountain"
+    assert rows[0]["postedWaitMinutes"] == "45"
+    mock_db.return_value.__enter__.return_value.scan_history.assert_not_called()
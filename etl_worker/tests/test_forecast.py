@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Tests for the etl_worker.forecast module.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+import numpy as np
+
+from etl_worker.forecast import fit, forecast_waits, predict
+
+# Monday 2019-01-07 00:00 UTC.
+MONDAY = 1546819200
+
+
+def test_fit_recovers_seasonal_profile():
+    """Forecasts follow a repeating hour-of-week pattern."""
+
+    # Two weeks of hourly samples, waits of 10 minutes except 40 minutes
+    # on Mondays at 12:00.
+    timestamps = MONDAY + 3600 * np.arange(2 * 168)
+    waits = np.where(np.arange(2 * 168) % 168 == 12, 40.0, 10.0)[:, np.newaxis]
+
+    level, profile = fit(timestamps, waits)
+    predicted = predict(level, profile, [MONDAY + 12 * 3600, MONDAY + 13 * 3600])
+    assert np.allclose(predicted[:, 0], [40, 10], atol=1)
+
+
+def test_fit_ignores_missing_samples():
+    """Missing waits don't count, experiences without any get NaN."""
+
+    timestamps = [MONDAY, MONDAY + 300]
+    waits = [[5.0, np.nan], [np.nan, np.nan]]
+
+    level, _ = fit(timestamps, waits)
+    assert level[0] == 5
+    assert np.isnan(level[1])
+
+
+def test_forecast_waits():
+    """Forecasts each horizon for experiences in the latest sample."""
+
+    samples = [
+        {"t": MONDAY, "waits": {"1": 20, "2": 5}},
+        {"t": MONDAY + 300, "waits": {"1": 20}},
+    ]
+
+    output = forecast_waits(samples=samples, now=MONDAY + 300, horizons=[30, 60])
+    assert output == {
+        "1": {
+            "id": "1",
+            "generatedAt": "2019-01-07T00:05:00+00:00",
+            "forecasts": [
+                {"minutes": 30, "postedWaitMinutes": 20},
+                {"minutes": 60, "postedWaitMinutes": 20},
+            ],
+        }
+    }
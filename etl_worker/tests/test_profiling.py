@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Tests for the etl_worker.profiling module.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+from unittest import mock
+
+from etl_worker.profiling import profiled
+
+
+def test_profiled_writes_profile(tmp_path):
+    """Writes one profile named after the block when sampled."""
+
+    with mock.patch("etl_worker.profiling.PROFILE_DIR", str(tmp_path)), mock.patch(
+        "etl_worker.profiling.PROFILE_SAMPLE_RATE", 1.0
+    ):
+        with profiled("experiences"):
+            sum(range(10))
+
+    profiles = list(tmp_path.iterdir())
+    assert len(profiles) == 1
+    assert profiles[0].name.startswith("experiences-")
+
+
+def test_profiled_disabled_without_profile_dir():
+    """Writes nothing when PROFILE_DIR is not set."""
+
+    with mock.patch("etl_worker.profiling.PROFILE_DIR", None), mock.patch(
+        "cProfile.Profile"
+    ) as mock_profile:
+        with profiled("experiences"):
+            pass
+
+    mock_profile.assert_not_called()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Tests for the etl_worker.retry module.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+from unittest import mock
+
+import pytest
+import requests
+
+from etl_worker.retry import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceededError,
+    RetryEngine,
+    RetryError,
+    TokenBucket,
+)
+
+
+class FakeClock:
+    """Clock advanced by sleeping instead of waiting."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _response(status_code, headers=None):
+    response = mock.Mock(status_code=status_code)
+    response.headers = headers or {}
+    return response
+
+
+def _engine(clock, **kwargs):
+    return RetryEngine(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_token_bucket_waits_when_empty():
+    """Sleeps for the time it takes to refill one token."""
+
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock, sleep=clock.sleep)
+
+    assert bucket.acquire() and bucket.acquire() and bucket.acquire()
+    assert clock.sleeps == [0.5]
+
+
+def test_token_bucket_refuses_past_deadline():
+    """Returns False without sleeping if the deadline would pass."""
+
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, capacity=1, clock=clock, sleep=clock.sleep)
+
+    assert bucket.acquire(deadline=0.5)
+    assert not bucket.acquire(deadline=0.5)
+    assert clock.sleeps == []
+
+
+def test_circuit_breaker_opens_and_resets():
+    """Opens at the threshold and lets one trial call through later."""
+
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    clock.now = 10
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+
+
+def test_request_retries_until_success():
+    """Retries retryable status codes and connection errors."""
+
+    clock = FakeClock()
+    send = mock.Mock(
+        side_effect=[_response(503), requests.ConnectionError(), _response(200)]
+    )
+
+    response = _engine(clock).request(send, endpoint="/a")
+    assert response.status_code == 200
+    assert send.call_count == 3
+    assert len(clock.sleeps) == 2
+
+
+def test_request_honors_retry_after():
+    """Waits for the number of seconds in a 'Retry-After' header."""
+
+    clock = FakeClock()
+    send = mock.Mock(side_effect=[_response(429, {"Retry-After": "3"}), _response(200)])
+
+    _engine(clock).request(send, endpoint="/a")
+    assert clock.sleeps == [3.0]
+
+
+def test_request_fails_on_long_retry_after():
+    """Raises `RetryError` instead of waiting longer than `max_delay`."""
+
+    clock = FakeClock()
+    engine = _engine(clock, max_delay=10)
+    send = mock.Mock(return_value=_response(429, {"Retry-After": "1800"}))
+
+    with engine.deadline(3600), pytest.raises(RetryError) as exc_info:
+        engine.request(send, endpoint="/a")
+    assert not isinstance(exc_info.value, DeadlineExceededError)
+    assert send.call_count == 1
+    assert clock.sleeps == []
+
+
+def test_request_fails_fast_on_client_error():
+    """Raises `RetryError` without retrying a 404."""
+
+    clock = FakeClock()
+    send = mock.Mock(return_value=_response(404))
+
+    with pytest.raises(RetryError):
+        _engine(clock).request(send, endpoint="/a")
+    assert send.call_count == 1
+
+
+def test_request_reauthenticates_on_401():
+    """Calls `on_reauth` and retries right away."""
+
+    clock = FakeClock()
+    send = mock.Mock(side_effect=[_response(401), _response(200)])
+    on_reauth = mock.Mock()
+
+    _engine(clock).request(send, endpoint="/a", on_reauth=on_reauth)
+    on_reauth.assert_called_once_with()
+    assert clock.sleeps == []
+
+
+def test_request_stops_at_deadline():
+    """Raises `DeadlineExceededError` rather than sleeping past the deadline."""
+
+    clock = FakeClock()
+    engine = _engine(clock, max_delay=60)
+    send = mock.Mock(return_value=_response(503, {"Retry-After": "30"}))
+
+    with engine.deadline(10), pytest.raises(DeadlineExceededError):
+        engine.request(send, endpoint="/a")
+    assert send.call_count == 1
+
+
+def test_request_opens_circuit_per_endpoint():
+    """Refuses requests to an endpoint after repeated failures only."""
+
+    clock = FakeClock()
+    engine = _engine(clock, max_attempts=2, failure_threshold=2)
+    failing = mock.Mock(return_value=_response(500))
+
+    with pytest.raises(RetryError):
+        engine.request(failing, endpoint="/a")
+    with pytest.raises(CircuitOpenError):
+        engine.request(failing, endpoint="/a")
+    assert failing.call_count == 2
+
+    response = engine.request(mock.Mock(return_value=_response(200)), endpoint="/b")
+    assert response.status_code == 200
+
+
+def test_request_ends_trial_on_unexpected_exception():
+    """Counts an exception raised by `send` as a failure, then re-raises it."""
+
+    clock = FakeClock()
+    engine = _engine(clock, failure_threshold=1, reset_timeout=60)
+    with pytest.raises(RetryError):
+        engine.request(mock.Mock(return_value=_response(500)), endpoint="/a")
+
+    # The half-open trial call raises.
+    clock.now += 61
+    with pytest.raises(KeyError):
+        engine.request(mock.Mock(side_effect=KeyError("token_type")), endpoint="/a")
+    with pytest.raises(CircuitOpenError):
+        engine.request(mock.Mock(), endpoint="/a")
+
+    clock.now += 61
+    response = engine.request(mock.Mock(return_value=_response(200)), endpoint="/a")
+    assert response.status_code == 200
@@ -8,12 +8,15 @@ license: MIT, see LICENSE for more details.
 
 from unittest import mock
 
+from etl_worker.retry import RetryError
 from etl_worker.tasks import (
     _api_request,
+    _diff_experience_data,
     _fetch_access_token,
     _fetch_experience_data,
     _fetch_park_data,
     _load_experience_data,
+    _load_history_sample,
     _load_park_data,
     _process_experience_data,
     _process_park_data,
@@ -40,7 +43,7 @@ def test__api_request_calls_requests_get(mock_fetch_access_token, mock_get):
     mock_get.return_value.status_code = 200
 
     _api_request(api_endpoint=endpoint)
-    mock_get.assert_called_with(expected_url, headers=expected_headers)
+    mock_get.assert_called_with(expected_url, headers=expected_headers, timeout=10)
 
 
 @mock.patch("requests.get")
@@ -57,6 +60,39 @@ def test__api_request_returns_response_json(mock_fetch_access_token, mock_get):
     assert response == sample_data
 
 
+@mock.patch("etl_worker.tasks.upstream.request")
+def test__api_request_returns_none_on_retry_error(mock_request):
+    """Returns None when no successful response is received."""
+
+    endpoint = "/facility-service/theme-parks/330339/wait-times"
+    mock_request.side_effect = RetryError("Failed.")
+
+    response = _api_request(api_endpoint=endpoint)
+    assert response is None
+
+
+def test__diff_experience_data():
+    """Reports added, removed and updated experiences only."""
+
+    old = {
+        "1": {"id": "1", "statusInfo": {"status": "Operating", "postedWaitMinutes": 5}},
+        "2": {"id": "2", "statusInfo": {"status": "Operating", "postedWaitMinutes": 5}},
+        "3": {"id": "3", "statusInfo": {"status": "Operating", "postedWaitMinutes": 5}},
+    }
+    new = {
+        "1": {"id": "1", "statusInfo": {"status": "Operating", "postedWaitMinutes": 5}},
+        "2": {"id": "2", "statusInfo": {"status": "Down"}},
+        "4": {"id": "4", "statusInfo": {"status": "Operating", "postedWaitMinutes": 0}},
+    }
+    expected_output = [
+        {"id": "2", "change": "updated", "status": "Down", "postedWaitMinutes": None},
+        {"id": "3", "change": "removed", "status": None, "postedWaitMinutes": None},
+        {"id": "4", "change": "added", "status": "Operating", "postedWaitMinutes": 0},
+    ]
+    output = _diff_experience_data(old=old, new=new)
+    assert output == expected_output
+
+
 @mock.patch("requests.post")
 def test__fetch_access_token_calls_requests_post(mock_post):
     """Calls `requests.post` with expected values."""
@@ -127,14 +163,46 @@ def test__fetch_park_data_calls_api_request(mock_api_request_func):
 
 
 @mock.patch("data_access.db_client.DBClient.write_experience_data")
-def test__load_experience_data_calls_DBClient(mock_write_experience_data):
+@mock.patch("data_access.db_client.DBClient.read_experiences")
+def test__load_experience_data_calls_DBClient(
+    mock_read_experiences, mock_write_experience_data
+):
     """Calls `DBClient.write_experience_data` with expected values."""
 
     park_id = "12345678"
     sample_data = {"12345678": {"A": 1, "B": 2}}
+    expected_changes = [
+        {"id": "12345678", "change": "added", "status": None, "postedWaitMinutes": None}
+    ]
+
+    mock_read_experiences.return_value = {}
 
     _load_experience_data(park_id=park_id, data=sample_data)
-    mock_write_experience_data.assert_called_with(park_id=park_id, data=sample_data)
+    mock_read_experiences.assert_called_with(park_id=park_id)
+    mock_write_experience_data.assert_called_with(
+        park_id=park_id, data=sample_data, changes=expected_changes
+    )
+
+
+@mock.patch("data_access.db_client.DBClient.write_history_sample")
+@mock.patch("data_access.db_client.DBClient.read_history_time")
+def test__load_history_sample_records_posted_waits(
+    mock_read_history_time, mock_write_history_sample
+):
+    """Records posted waits if the latest sample is old enough."""
+
+    park_id = "12345678"
+    sample_data = {
+        "1": {"statusInfo": {"status": "Operating", "postedWaitMinutes": 5}},
+        "2": {"statusInfo": {"status": "Closed"}},
+    }
+    mock_read_history_time.return_value = 1000.0
+
+    assert not _load_history_sample(park_id=park_id, data=sample_data, timestamp=1060)
+    assert _load_history_sample(park_id=park_id, data=sample_data, timestamp=1300)
+    mock_write_history_sample.assert_called_once_with(
+        park_id=park_id, timestamp=1300, data={"1": 5}, retention=14 * 24 * 3600
+    )
 
 
 @mock.patch("data_access.db_client.DBClient.write_park_data")
@@ -256,16 +324,45 @@ def test__process_park_data():
     assert output == expected_output
 
 
+@mock.patch("etl_worker.tasks._load_forecasts")
+@mock.patch("etl_worker.tasks._load_history_sample")
 @mock.patch("etl_worker.tasks._load_experience_data")
 @mock.patch("etl_worker.tasks._process_experience_data")
 @mock.patch("etl_worker.tasks._fetch_experience_data")
-def test_update_experiences_count(mock_fetch_data, mock_process_data, mock_load_data):
+def test_update_experiences_count(
+    mock_fetch_data,
+    mock_process_data,
+    mock_load_data,
+    mock_load_history_sample,
+    mock_load_forecasts,
+):
     """Calls functions to fetch, process and load data 6 times."""
 
     update_experiences()
     assert mock_fetch_data.call_count == 6
     assert mock_process_data.call_count == 6
     assert mock_load_data.call_count == 6
+    assert mock_load_history_sample.call_count == 6
+
+
+@mock.patch("etl_worker.tasks._load_forecasts")
+@mock.patch("etl_worker.tasks._load_history_sample")
+@mock.patch("etl_worker.tasks._load_experience_data")
+@mock.patch("etl_worker.tasks._process_experience_data")
+@mock.patch("etl_worker.tasks._fetch_experience_data")
+def test_update_experiences_refits_forecasts_on_new_sample(
+    mock_fetch_data,
+    mock_process_data,
+    mock_load_data,
+    mock_load_history_sample,
+    mock_load_forecasts,
+):
+    """Loads forecasts only for parks where a history sample was recorded."""
+
+    mock_load_history_sample.side_effect = [True, False, False, False, False, True]
+
+    update_experiences()
+    assert mock_load_forecasts.call_count == 2
 
 
 @mock.patch("etl_worker.tasks._load_park_data")
@@ -10,9 +10,12 @@ license: MIT, see LICENSE for more details.
 
 import connexion
 
+import profiling
+
 app = connexion.App(__name__, specification_dir="./")
 app.app.url_map.strict_slashes = False
 app.add_api("swagger.yml")
+profiling.init_app(app.app)
 
 if __name__ == "__main__":
     # FLASK_ENV=development & FLASK_DEBUG=1 w/ Docker don't seem to enable debug mode.
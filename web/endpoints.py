@@ -8,12 +8,171 @@ license: MIT, see LICENSE for more details.
 
 """
 
-from flask import abort, json
+import os
+import threading
+import time
 
-from data_access import DBClient
+from flask import Response, abort, json, stream_with_context
+
+from data_access import DBClient, SingleFlight
+from data_access.export import export
+from search import ExperienceIndex
+
+UPDATE_FREQ_SCHEDULES = int(os.environ.get("UPDATE_FREQ_SCHEDULES", 3600))
+UPDATE_FREQ_EXPERIENCES = int(os.environ.get("UPDATE_FREQ_EXPERIENCES", 60))
+EXPORT_MAX_CONCURRENT = int(os.environ.get("EXPORT_MAX_CONCURRENT", 1))
+
+# Lower bound of max-age once an update is overdue, so that caches keep
+# absorbing traffic while the ETL worker catches up.
+MIN_MAX_AGE = 5
+
+# Seconds searches wait for a worker's search index to be first built.
+INDEX_READY_TIMEOUT = 5.0
 
 unspecified = object()
 
+# Concurrent identical reads within this worker share one DB round trip.
+_flight = SingleFlight()
+
+# Name index of all experiences, refreshed as parks get updated.
+_index = ExperienceIndex()
+
+# Exports streaming in this worker, each holding a thread until it ends.
+_export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+
+
+def _cache_headers(*, updated, update_freq):
+    """Build a Cache-Control header valid until the next scheduled update.
+
+    Caches may keep serving a response for up to one more update period
+    while they revalidate it in the background.
+
+    Parameters
+    ----------
+    updated : str or None
+        Unix timestamp of the last update of the served data.
+    update_freq : int
+        Number of seconds between updates of the served data.
+
+    Returns
+    -------
+    dict
+        Response headers.
+
+    """
+
+    if updated is None:
+        return {"Cache-Control": "public, max-age=0"}
+    max_age = int(float(updated) + update_freq - time.time())
+    max_age = max(MIN_MAX_AGE, min(max_age, update_freq))
+    return {
+        "Cache-Control": (
+            f"public, max-age={max_age}, stale-while-revalidate={update_freq}"
+        )
+    }
+
+
+def _fetch_parks():
+    """Read and decode all park records.
+
+    Returns
+    -------
+    tuple
+        List of dicts and Unix timestamp of the least recent update.
+
+    """
+
+    with DBClient() as DB:
+        update_times = DB.read_update_times(dataset="parks")
+        latest = max(update_times.values(), key=float, default=None)
+        parks = DB.read_coalesced(
+            key=f"parks:{latest}",
+            fetch=lambda: [json.loads(data) for data in DB.read_parks().values()],
+        )
+    # The listing is stale as soon as any one park gets updated.
+    return parks, min(update_times.values(), key=float, default=None)
+
+
+def _fetch_park(park_id):
+    """Read and decode one park record.
+
+    Returns
+    -------
+    tuple
+        Dict or None, and Unix timestamp of the last update.
+
+    """
+
+    with DBClient() as DB:
+        park_data = DB.read_park(park_id=park_id)
+        updated = DB.read_update_time(dataset="parks", park_id=park_id)
+    return json.loads(park_data) if park_data else None, updated
+
+
+def _fetch_experiences(park_id):
+    """Read and decode all experiences in a park.
+
+    Returns
+    -------
+    tuple
+        List of dicts or None, and Unix timestamp of the last update.
+
+    """
+
+    with DBClient() as DB:
+        updated = DB.read_update_time(dataset="experiences", park_id=park_id)
+        experiences = DB.read_coalesced(
+            key=f"{park_id}:experiences:{updated}",
+            fetch=lambda: [
+                json.loads(data)
+                for data in DB.read_experiences(park_id=park_id).values()
+            ],
+        )
+    return experiences or None, updated
+
+
+def _fetch_filtered_experiences(park_id, _type, status, fields):
+    """Read and decode experiences in a park matching filters.
+
+    Returns
+    -------
+    tuple
+        List of dicts or None, and Unix timestamp of the last update.
+
+    """
+
+    with DBClient() as DB:
+        experience_data = DB.read_experiences_filtered(
+            park_id=park_id, _type=_type, status=status, fields=fields
+        )
+        updated = DB.read_update_time(dataset="experiences", park_id=park_id)
+    if experience_data is None:
+        return None, updated
+    return [json.loads(data) for data in experience_data], updated
+
+
+def _fetch_experience(park_id, experience_id, fields):
+    """Read and decode one experience, optionally selected fields only.
+
+    Returns
+    -------
+    tuple
+        Dict or None, and Unix timestamp of the last update.
+
+    """
+
+    with DBClient() as DB:
+        if fields:
+            experience_data = DB.read_experience_fields(
+                park_id=park_id, experience_id=experience_id, fields=fields
+            )
+        else:
+            experience_data = DB.read_experience(
+                park_id=park_id, experience_id=experience_id
+            )
+        updated = DB.read_update_time(dataset="experiences", park_id=park_id)
+    return json.loads(experience_data) if experience_data else None, updated
+
 
 def read_parks():
     """Handler for /parks endpoint.
@@ -22,7 +181,8 @@ def read_parks():
 
     Returns
     -------
-    list of dicts
+    tuple
+        List of dicts, status code and Cache-Control header.
 
     Raises
     ------
@@ -31,13 +191,13 @@ def read_parks():
 
     """
 
-    with DBClient() as DB:
-        parks_data = DB.read_parks()
-    response = []
-    for _, data in parks_data.items():
-        response.append(json.loads(data))
+    response, updated = _flight.do("parks", _fetch_parks)
     if response:
-        return response
+        return (
+            response,
+            200,
+            _cache_headers(updated=updated, update_freq=UPDATE_FREQ_SCHEDULES),
+        )
     else:
         abort(404, f"No park records found.")
 
@@ -54,7 +214,8 @@ def read_park(park_id):
 
     Returns
     -------
-    dict
+    tuple
+        Dict, status code and Cache-Control header.
 
     Raises
     ------
@@ -63,15 +224,20 @@ def read_park(park_id):
 
     """
 
-    with DBClient() as DB:
-        park_data = DB.read_park(park_id=park_id)
+    park_data, updated = _flight.do(("park", park_id), lambda: _fetch_park(park_id))
     if park_data:
-        return json.loads(park_data)
+        return (
+            park_data,
+            200,
+            _cache_headers(updated=updated, update_freq=UPDATE_FREQ_SCHEDULES),
+        )
     else:
         abort(404, f"Park ID not found.")
 
 
-def read_experiences(park_id, _type=unspecified):
+def read_experiences(
+    park_id, _type=unspecified, status=unspecified, fields=unspecified
+):
     """Handler for /parks/{park_id}/experiences endpoint.
 
     Retrieves all experiences under the specified park from database.
@@ -82,39 +248,278 @@ def read_experiences(park_id, _type=unspecified):
         A park ID.
     _type : str, optional
         Experience type used for filtering.
+    status : str, optional
+        Experience status used for filtering.
+    fields : list of str, optional
+        Fields to include in each experience.
 
     Returns
     -------
-    list of dicts
+    tuple
+        List of dicts, status code and Cache-Control header.
 
     Raises
     ------
     werkzeug.exceptions.NotFound
         If no match is found for `park_id`.
-        If `_type` is specified but no match is found.
+        If `_type` and/or `status` is specified but no match is found.
 
     """
 
-    with DBClient() as DB:
-        experience_data = DB.read_experiences(park_id=park_id)
-    if not experience_data:
+    if _type is unspecified and status is unspecified and fields is unspecified:
+        experience_data, updated = _flight.do(
+            ("experiences", park_id), lambda: _fetch_experiences(park_id)
+        )
+    else:
+        # Filtering and projection are done in Redis.
+        query = (
+            "" if _type is unspecified else _type,
+            "" if status is unspecified else status,
+            () if fields is unspecified else tuple(fields),
+        )
+        experience_data, updated = _flight.do(
+            ("experiences", park_id, *query),
+            lambda: _fetch_filtered_experiences(park_id, *query),
+        )
+    if experience_data is None:
         abort(404, f"Park ID not found.")
-    response = []
-    for _, data in experience_data.items():
-        experience = json.loads(data)
-        if _type is unspecified:
-            response.append(experience)
-        elif _type is not unspecified and _type.lower() == experience["type"].lower():
-            response.append(experience)
-
-    if response:
-        return response
-    elif _type is not unspecified:
+    elif experience_data:
+        return (
+            experience_data,
+            200,
+            _cache_headers(updated=updated, update_freq=UPDATE_FREQ_EXPERIENCES),
+        )
+    elif status is unspecified:
         # park_id returned results but no match for _type.
         abort(404, f"Experience of type '{_type}' not found.")
+    else:
+        abort(404, f"No experiences match the given filters.")
+
 
+def _fetch_top_experiences(park_id, _type, order, limit):
+    """Read and decode experiences in a park ranked by posted wait.
+
+    Returns
+    -------
+    tuple
+        List of dicts or None, and Unix timestamp of the last update.
+
+    """
+
+    with DBClient() as DB:
+        experience_data = DB.read_top_waits(
+            park_id=park_id, _type=_type, order=order, limit=limit
+        )
+        updated = DB.read_update_time(dataset="experiences", park_id=park_id)
+    if experience_data is None:
+        return None, updated
+    return [json.loads(data) for data in experience_data if data], updated
+
+
+def read_top_experiences(park_id, order="asc", limit=10, _type=unspecified):
+    """Handler for /parks/{park_id}/experiences/top endpoint.
+
+    Retrieves the experiences with the shortest or longest posted waits
+    in the specified park from database.
+
+    Parameters
+    ----------
+    park_id : str
+        A park ID.
+    order : {"asc", "desc"}, optional
+        Shortest waits first for "asc", longest first for "desc".
+    limit : int, optional
+        Maximum number of experiences to return.
+    _type : str, optional
+        Experience type used for filtering.
+
+    Returns
+    -------
+    tuple
+        List of dicts, status code and Cache-Control header.
+
+    Raises
+    ------
+    werkzeug.exceptions.NotFound
+        If no match is found for `park_id`.
+        If no experiences with a posted wait are found.
+
+    """
+
+    query = ("" if _type is unspecified else _type, order, limit)
+    experience_data, updated = _flight.do(
+        ("top", park_id, *query), lambda: _fetch_top_experiences(park_id, *query)
+    )
+    if experience_data is None:
+        abort(404, f"Park ID not found.")
+    elif experience_data:
+        return (
+            experience_data,
+            200,
+            _cache_headers(updated=updated, update_freq=UPDATE_FREQ_EXPERIENCES),
+        )
+    else:
+        abort(404, f"No experiences with a posted wait found.")
 
-def read_experience(park_id, experience_id):
+
+def _fetch_resort_top_experiences(_type, order, limit):
+    """Read and decode experiences in all parks ranked by posted wait.
+
+    Returns
+    -------
+    tuple
+        List of dicts, and Unix timestamp of the least recent update.
+
+    """
+
+    with DBClient() as DB:
+        experience_data = DB.read_resort_top_waits(
+            _type=_type, order=order, limit=limit
+        )
+        update_times = DB.read_update_times(dataset="experiences")
+    experiences = [
+        dict(json.loads(data), parkId=park_id) for park_id, data in experience_data
+    ]
+    return experiences, min(update_times.values(), key=float, default=None)
+
+
+def read_resort_top_experiences(order="asc", limit=10, _type=unspecified):
+    """Handler for /experiences/top endpoint.
+
+    Retrieves the experiences with the shortest or longest posted waits
+    across all parks from database.
+
+    Parameters
+    ----------
+    order : {"asc", "desc"}, optional
+        Shortest waits first for "asc", longest first for "desc".
+    limit : int, optional
+        Maximum number of experiences to return.
+    _type : str, optional
+        Experience type used for filtering.
+
+    Returns
+    -------
+    tuple
+        List of dicts, status code and Cache-Control header.
+
+    Raises
+    ------
+    werkzeug.exceptions.NotFound
+        If no experiences with a posted wait are found.
+
+    """
+
+    query = ("" if _type is unspecified else _type, order, limit)
+    experience_data, updated = _flight.do(
+        ("top", None, *query), lambda: _fetch_resort_top_experiences(*query)
+    )
+    if experience_data:
+        return (
+            experience_data,
+            200,
+            _cache_headers(updated=updated, update_freq=UPDATE_FREQ_EXPERIENCES),
+        )
+    else:
+        abort(404, f"No experiences with a posted wait found.")
+
+
+def read_changes(park_id, since=unspecified, limit=1000):
+    """Handler for /parks/{park_id}/changes endpoint.
+
+    Retrieves experience status and posted wait changes in the specified
+    park from database, starting after the `since` cursor.
+
+    Parameters
+    ----------
+    park_id : str
+        A park ID.
+    since : str, optional
+        Cursor returned by a previous request, read from the oldest
+        change kept if unspecified.
+    limit : int, optional
+        Maximum number of changes to return.
+
+    Returns
+    -------
+    tuple
+        Dict, status code and Cache-Control header.
+
+    Raises
+    ------
+    werkzeug.exceptions.NotFound
+        If no match is found for `park_id`.
+
+    """
+
+    since = None if since is unspecified else since
+    with DBClient() as DB:
+        updated = DB.read_update_time(dataset="experiences", park_id=park_id)
+        entries, trimmed = DB.read_changes(park_id=park_id, since=since, count=limit)
+    if updated is None:
+        abort(404, f"Park ID not found.")
+
+    def stream_id(cursor):
+        return tuple(int(part) for part in cursor.split("-"))
+
+    changes = [dict(json.loads(data), cursor=cursor) for cursor, data in entries]
+    if changes:
+        cursor = changes[-1]["cursor"]
+    else:
+        cursor = since or "0-0"
+    return (
+        {
+            "changes": changes,
+            "cursor": cursor,
+            # Changes following `since` were trimmed before being read.
+            "truncated": bool(
+                since and trimmed and stream_id(since) < stream_id(trimmed)
+            ),
+        },
+        200,
+        _cache_headers(updated=updated, update_freq=UPDATE_FREQ_EXPERIENCES),
+    )
+
+
+def read_forecast(park_id, experience_id):
+    """Handler for /parks/{park_id}/experiences/{experience_id}/forecast endpoint
+
+    Retrieves posted wait forecasts for one experience from database.
+    Forecasts are precomputed by the ETL worker.
+
+    Parameters
+    ----------
+    park_id : str
+        A park ID.
+    experience_id : str
+        An experience ID.
+
+    Returns
+    -------
+    tuple
+        Dict, status code and Cache-Control header.
+
+    Raises
+    ------
+    werkzeug.exceptions.NotFound
+        If no forecast is found for `park_id` and/or `experience_id`.
+
+    """
+
+    with DBClient() as DB:
+        forecast_data = DB.read_forecast(park_id=park_id, experience_id=experience_id)
+        updated = DB.read_update_time(dataset="experiences", park_id=park_id)
+    if forecast_data:
+        return (
+            json.loads(forecast_data),
+            200,
+            _cache_headers(updated=updated, update_freq=UPDATE_FREQ_EXPERIENCES),
+        )
+    else:
+        abort(404, f"No forecast found for park and/or experience ID.")
+
+
+def read_experience(park_id, experience_id, fields=unspecified):
     """Handler for /parks/{park_id}/experiences/{experience_id} endpoint
 
     Retrieves one experience from database.
@@ -125,10 +530,13 @@ def read_experience(park_id, experience_id):
         A park ID.
     experience_id : str
         An experience ID.
+    fields : list of str, optional
+        Fields to include in the experience.
 
     Returns
     -------
-    dict
+    tuple
+        Dict, status code and Cache-Control header.
 
     Raises
     ------
@@ -137,11 +545,133 @@ def read_experience(park_id, experience_id):
 
     """
 
-    with DBClient() as DB:
-        experience_data = DB.read_experience(
-            park_id=park_id, experience_id=experience_id
+    fields = () if fields is unspecified else tuple(fields)
+    experience_data, updated = _flight.do(
+        ("experience", park_id, experience_id, fields),
+        lambda: _fetch_experience(park_id, experience_id, fields),
+    )
+    if experience_data is not None:
+        return (
+            experience_data,
+            200,
+            _cache_headers(updated=updated, update_freq=UPDATE_FREQ_EXPERIENCES),
         )
-    if experience_data:
-        return json.loads(experience_data)
     else:
         abort(404, f"Park and/or experience ID not found.")
+
+
+def _refresh_index():
+    """Load experiences of updated parks into the search index."""
+
+    with DBClient() as DB:
+        _index.refresh(
+            update_times=DB.read_update_times(dataset="experiences"),
+            load=lambda park_id: [
+                json.loads(data)
+                for data in DB.read_experiences_filtered(
+                    park_id=park_id, fields=("id", "name", "type")
+                )
+                or ()
+            ],
+        )
+
+
+def search_experiences(q, park_id=unspecified, limit=25):
+    """Handler for /experiences/search endpoint.
+
+    Searches experience names across all parks, matching each word in
+    the query as a prefix of a word in the name. The index is refreshed
+    by a background thread every UPDATE_FREQ_EXPERIENCES seconds, so
+    searches don't touch the database.
+
+    Parameters
+    ----------
+    q : str
+        Search string.
+    park_id : str, optional
+        A park ID used for filtering.
+    limit : int, optional
+        Maximum number of matches to return.
+
+    Returns
+    -------
+    tuple
+        List of dicts, status code and Cache-Control header.
+
+    Raises
+    ------
+    werkzeug.exceptions.NotFound
+        If no match is found for `q`.
+
+    """
+
+    _index.start_refresher(interval=UPDATE_FREQ_EXPERIENCES, refresh=_refresh_index)
+    # Only searches arriving before the worker's first refresh wait.
+    _index.wait_ready(timeout=INDEX_READY_TIMEOUT)
+    update_times = _index.update_times
+    matches = _index.search(
+        q, park_id=None if park_id is unspecified else park_id, limit=limit
+    )
+    if matches:
+        response = [
+            {"parkId": match[0], "id": match[1], "name": match[2], "type": match[3]}
+            for match in matches
+        ]
+        updated = min(update_times.values(), key=float)
+        return (
+            response,
+            200,
+            _cache_headers(updated=updated, update_freq=UPDATE_FREQ_EXPERIENCES),
+        )
+    else:
+        abort(404, f"No experiences matching '{q}' found.")
+
+
+def export_data(format="ndjson", history=True):
+    """Handler for /export endpoint.
+
+    Streams all parks' current experiences, and optionally their posted
+    wait history, as NDJSON or CSV. Data is read from the database in
+    batches while the response is sent, so memory use doesn't depend on
+    the size of the export. At most EXPORT_MAX_CONCURRENT exports stream
+    at once in each worker, leaving its other threads to serve the rest
+    of the API.
+
+    Parameters
+    ----------
+    format : {"ndjson", "csv"}, optional
+        Output format.
+    history : bool, optional
+        Include posted wait history samples.
+
+    Returns
+    -------
+    flask.Response
+        Streamed response.
+
+    Raises
+    ------
+    werkzeug.exceptions.ServiceUnavailable
+        If the worker is already streaming EXPORT_MAX_CONCURRENT exports.
+
+    """
+
+    if not _export_slots.acquire(blocking=False):
+        abort(503, f"Too many exports in progress, try again later.")
+
+    def generate():
+        with DBClient() as DB:
+            yield from export(DB, fmt=format, include_history=history)
+
+    mimetype = "text/csv" if format == "csv" else "application/x-ndjson"
+    response = Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={
+            "Cache-Control": "no-store",
+            "Content-Disposition": f"attachment; filename=export.{format}",
+        },
+    )
+    # Called when the stream ends, also if the client disconnects early.
+    response.call_on_close(_export_slots.release)
+    return response
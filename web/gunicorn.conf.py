@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+Gunicorn settings for the web service.
+
+Workers are threaded, so that each serves concurrent requests. This
+lets `SingleFlight` coalesce identical reads that arrive together in a
+worker, and keeps one slow request, like a bulk export, from holding up
+the others.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+import os
+
+bind = "0.0.0.0:8000"
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_WORKERS", 2))
+threads = int(os.environ.get("WEB_THREADS", 8))
+
+# Threaded workers report to the arbiter from their main loop, so the
+# timeout only catches hung workers, not requests streaming for longer.
+timeout = int(os.environ.get("WEB_TIMEOUT", 30))
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements opt-in profiling of API requests with cProfile.
+
+Profiling is off unless the PROFILE_DIR environment variable is set, in
+which case requests are profiled at random at PROFILE_SAMPLE_RATE, or
+when sent with an 'X-Profile: 1' header. Profiles are written to
+PROFILE_DIR as request-<trace ID>.prof, and the trace ID is returned in
+the 'X-Trace-Id' response header. Profiled responses are sent with
+'Cache-Control: no-store', so that caches don't share the trace ID.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+import cProfile
+import os
+import random
+import uuid
+
+from flask import g, request
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+
+
+def init_app(app):
+    """Register profiling hooks on a Flask app, if profiling is enabled.
+
+    Parameters
+    ----------
+    app : flask.Flask
+
+    """
+
+    if not PROFILE_DIR:
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    app.before_request(_start_profile)
+    app.after_request(_save_profile)
+    app.teardown_request(_stop_profile)
+
+
+def _start_profile():
+    """Start profiling the request if it's sampled or asks for a profile."""
+
+    if request.headers.get("X-Profile") == "1" or random.random() < PROFILE_SAMPLE_RATE:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def _save_profile(response):
+    """Write the request's profile, if any, and add its trace ID header."""
+
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        trace_id = uuid.uuid4().hex
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"request-{trace_id}.prof"))
+        response.headers["X-Trace-Id"] = trace_id
+        # The trace ID is only meant for this client.
+        response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+def _stop_profile(exception):
+    """Stop a profile left running by a request that failed.
+
+    Requests failing with an unhandled exception skip `_save_profile`.
+
+    """
+
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements an in-memory index used to search experiences
+by name across all parks.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_token_pattern = re.compile(r"\w+")
+
+
+def _tokenize(text):
+    """Split text into lower case word tokens."""
+
+    return _token_pattern.findall(text.lower())
+
+
+class ExperienceIndex:
+    """Index of experience names, matching on token prefixes.
+
+    Entries are kept per park along with the park's last update time,
+    and the token list is only rebuilt when a park's entries change.
+    Lookups binary search a sorted token list, so their cost depends on
+    the number of matching tokens rather than the number of parks.
+
+    Refreshes can run in a background thread started with
+    `start_refresher`, while lookups keep using the current snapshot.
+
+    Attributes
+    ----------
+    update_times : dict
+        Update times passed to the last `refresh`.
+    refreshed : float or None
+        `time.monotonic` time of the last `refresh`.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._parks = {}
+        # Entries are (park_id, experience_id, name, type) tuples grouped
+        # by park, postings hold the ascending positions of entries
+        # containing each token, and ranges the positions of each park.
+        self._snapshot = ((), (), (), {})
+        self.update_times = {}
+        self.refreshed = None
+        self._ready = threading.Event()
+        self._refresher = None
+
+    def refresh(self, *, update_times, load):
+        """Update the index for parks whose data has changed.
+
+        Parameters
+        ----------
+        update_times : dict
+            Unix timestamps of the last update keyed by park ID.
+        load : callable
+            Called with a park ID, returns that park's experiences as
+            dicts with at least 'id', 'name' and 'type' keys.
+
+        """
+
+        with self._lock:
+            changed = set(self._parks) - set(update_times)
+            for park_id in changed:
+                del self._parks[park_id]
+            for park_id, updated in update_times.items():
+                current = self._parks.get(park_id)
+                if current is not None and current[0] == updated:
+                    continue
+                entries = tuple(
+                    sorted(
+                        (park_id, e["id"], e["name"], e["type"]) for e in load(park_id)
+                    )
+                )
+                if current is None or current[1] != entries:
+                    changed.add(park_id)
+                self._parks[park_id] = (updated, entries)
+            if changed:
+                self._snapshot = self._build()
+            self.update_times = dict(update_times)
+            self.refreshed = time.monotonic()
+        self._ready.set()
+
+    def start_refresher(self, *, interval, refresh):
+        """Call `refresh` in a daemon thread every `interval` seconds.
+
+        Only the first call starts a thread, later calls do nothing.
+
+        Parameters
+        ----------
+        interval : float
+            Seconds between the end of one refresh and the next.
+        refresh : callable
+            Called without arguments, expected to call `refresh`.
+
+        """
+
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(
+                target=self._run_refresher,
+                args=(interval, refresh),
+                name="index-refresher",
+                daemon=True,
+            )
+        self._refresher.start()
+
+    def _run_refresher(self, interval, refresh):
+        """Refresh forever, logging failures."""
+
+        while True:
+            try:
+                refresh()
+            except Exception:
+                logger.exception("Refreshing the search index failed.")
+            time.sleep(interval)
+
+    def wait_ready(self, timeout=None):
+        """Block until the first refresh completes.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum seconds to wait.
+
+        Returns
+        -------
+        bool
+            False if the index wasn't ready before the timeout.
+
+        """
+
+        return self._ready.wait(timeout)
+
+    def _build(self):
+        """Build the sorted token list, postings and park ranges."""
+
+        entries = []
+        ranges = {}
+        for park_id in sorted(self._parks):
+            start = len(entries)
+            entries.extend(self._parks[park_id][1])
+            ranges[park_id] = (start, len(entries))
+        postings = {}
+        for position, entry in enumerate(entries):
+            for token in set(_tokenize(entry[2])):
+                postings.setdefault(token, []).append(position)
+        tokens = tuple(sorted(postings))
+        return (
+            tokens,
+            tuple(tuple(postings[token]) for token in tokens),
+            tuple(entries),
+            ranges,
+        )
+
+    def search(self, query, *, park_id=None, limit=25):
+        """Find experiences with names matching all tokens in `query`.
+
+        Each query token must be a prefix of a token in the name. Names
+        starting with the query are ranked first, then names in
+        alphabetical order.
+
+        Parameters
+        ----------
+        query : str
+            Search string, case-insensitive.
+        park_id : str, optional
+            Only return experiences in this park.
+        limit : int, optional
+            Maximum number of matches to return.
+
+        Returns
+        -------
+        list of tuples
+            (park_id, experience_id, name, type) of each match.
+
+        """
+
+        tokens, postings, entries, ranges = self._snapshot
+        query_tokens = _tokenize(query)
+        if not query_tokens:
+            return []
+        if park_id is None:
+            park_start, park_end = 0, len(entries)
+        elif park_id in ranges:
+            park_start, park_end = ranges[park_id]
+        else:
+            return []
+
+        matches = None
+        for query_token in set(query_tokens):
+            start = bisect.bisect_left(tokens, query_token)
+            end = bisect.bisect_left(tokens, query_token + "\uffff", start)
+            positions = set()
+            for i in range(start, end):
+                # Only take the positions in the park's range of entries.
+                posting = postings[i]
+                first = bisect.bisect_left(posting, park_start)
+                last = bisect.bisect_left(posting, park_end, first)
+                positions.update(posting[first:last])
+            matches = positions if matches is None else matches & positions
+            if not matches:
+                return []
+
+        prefix = query.strip().lower()
+        return heapq.nsmallest(
+            limit,
+            (entries[position] for position in matches),
+            key=lambda entry: (
+                not entry[2].lower().startswith(prefix),
+                entry[2],
+                entry,
+            ),
+        )
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""Tests for the endpoints module.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+import json
+import threading
+from unittest import mock
+
+import flask
+import pytest
+from werkzeug.exceptions import NotFound, ServiceUnavailable
+
+import endpoints
+from endpoints import (
+    _cache_headers,
+    export_data,
+    read_experience,
+    read_changes,
+    read_experiences,
+    read_resort_top_experiences,
+    search_experiences,
+)
+
+
+@mock.patch("time.time", return_value=1000.0)
+def test__cache_headers_until_next_update(mock_time):
+    """Sets max-age to the time left until the next scheduled update."""
+
+    headers = _cache_headers(updated="980.5", update_freq=60)
+
+    assert headers == {"Cache-Control": "public, max-age=40, stale-while-revalidate=60"}
+
+
+@mock.patch("time.time", return_value=1000.0)
+def test__cache_headers_caps_max_age(mock_time):
+    """Never sets max-age above the update frequency."""
+
+    headers = _cache_headers(updated="1100", update_freq=60)
+
+    assert headers["Cache-Control"].startswith("public, max-age=60,")
+
+
+@mock.patch("time.time", return_value=1000.0)
+def test__cache_headers_overdue_update(mock_time):
+    """Keeps a small max-age when the update is overdue."""
+
+    headers = _cache_headers(updated="800", update_freq=60)
+
+    assert headers == {"Cache-Control": "public, max-age=5, stale-while-revalidate=60"}
+
+
+def test__cache_headers_without_update_time():
+    """Disables caching when the update time is unknown."""
+
+    assert _cache_headers(updated=None, update_freq=60) == {
+        "Cache-Control": "public, max-age=0"
+    }
+
+
+@mock.patch("endpoints.DBClient")
+def test_read_experiences_with_filters(mock_DBClient):
+    """Passes filters and fields to `DBClient.read_experiences_filtered`."""
+
+    DB = mock_DBClient.return_value.__enter__.return_value
+    DB.read_experiences_filtered.return_value = ['{"id": "1", "name": "Dumbo"}']
+    DB.read_update_time.return_value = None
+
+    response, status_code, _ = read_experiences(
+        "p", _type="Attraction", status="Operating", fields=["id", "name"]
+    )
+
+    DB.read_experiences_filtered.assert_called_once_with(
+        park_id="p", _type="Attraction", status="Operating", fields=("id", "name")
+    )
+    assert response == [{"id": "1", "name": "Dumbo"}]
+    assert status_code == 200
+
+
+@mock.patch("endpoints.DBClient")
+def test_read_experiences_without_filter_match(mock_DBClient):
+    """Raises NotFound if no experience matches the status filter."""
+
+    DB = mock_DBClient.return_value.__enter__.return_value
+    DB.read_experiences_filtered.return_value = []
+
+    with pytest.raises(NotFound) as exc_info:
+        read_experiences("p", status="Closed")
+    assert "filters" in exc_info.value.description
+
+
+@mock.patch("endpoints.DBClient")
+def test_read_experiences_missing_park(mock_DBClient):
+    """Raises NotFound if the park is not found."""
+
+    DB = mock_DBClient.return_value.__enter__.return_value
+    DB.read_experiences_filtered.return_value = None
+
+    with pytest.raises(NotFound) as exc_info:
+        read_experiences("missing", fields=["id"])
+    assert "Park ID" in exc_info.value.description
+
+
+@mock.patch("endpoints.DBClient")
+def test_read_experience_with_fields(mock_DBClient):
+    """Reads only the requested fields with `DBClient.read_experience_fields`."""
+
+    DB = mock_DBClient.return_value.__enter__.return_value
+    DB.read_experience_fields.return_value = json.dumps({"name": "Dumbo"})
+    DB.read_update_time.return_value = None
+
+    response, status_code, _ = read_experience("p", "1", fields=["name"])
+
+    DB.read_experience_fields.assert_called_once_with(
+        park_id="p", experience_id="1", fields=("name",)
+    )
+    DB.read_experience.assert_not_called()
+    assert response == {"name": "Dumbo"}
+
+
+@mock.patch("endpoints.DBClient")
+def test_read_experience_missing_experience(mock_DBClient):
+    """Raises NotFound if the experience is not found."""
+
+    DB = mock_DBClient.return_value.__enter__.return_value
+    DB.read_experience_fields.return_value = None
+
+    with pytest.raises(NotFound):
+        read_experience("p", "9", fields=["name"])
+
+
+@mock.patch("endpoints.DBClient")
+def test_search_experiences_refreshes_index_in_background(mock_DBClient, monkeypatch):
+    """Builds the index in a background thread, started once per worker."""
+
+    index = endpoints.ExperienceIndex()
+    monkeypatch.setattr(endpoints, "_index", index)
+    DB = mock_DBClient.return_value.__enter__.return_value
+    DB.read_update_times.return_value = {"p": "1000"}
+    DB.read_experiences_filtered.return_value = [
+        '{"id": "1", "name": "Dumbo the Flying Elephant", "type": "Attraction"}'
+    ]
+
+    with mock.patch.object(
+        index, "start_refresher", wraps=index.start_refresher
+    ) as mock_start_refresher:
+        response, status_code, _ = search_experiences("dumbo")
+        search_experiences("flying", park_id="p")
+
+    assert response == [
+        {
+            "parkId": "p",
+            "id": "1",
+            "name": "Dumbo the Flying Elephant",
+            "type": "Attraction",
+        }
+    ]
+    assert index._refresher.daemon
+    assert mock_start_refresher.call_count == 2
+    assert DB.read_update_times.call_count == 1
+
+
+@mock.patch("endpoints.DBClient")
+def test_read_resort_top_experiences(mock_DBClient):
+    """Returns ranked experiences from all parks with their park IDs."""
+
+    DB = mock_DBClient.return_value.__enter__.return_value
+    DB.read_resort_top_waits.return_value = [
+        ("q", '{"id": "2", "name": "Soarin"}'),
+        ("p", '{"id": "1", "name": "Dumbo"}'),
+    ]
+    DB.read_update_times.return_value = {"p": "1000", "q": "1010"}
+
+    response, status_code, _ = read_resort_top_experiences(order="desc", limit=2)
+
+    DB.read_resort_top_waits.assert_called_once_with(_type="", order="desc", limit=2)
+    assert response == [
+        {"id": "2", "name": "Soarin", "parkId": "q"},
+        {"id": "1", "name": "Dumbo", "parkId": "p"},
+    ]
+
+
+@mock.patch("endpoints.DBClient")
+def test_read_resort_top_experiences_without_waits(mock_DBClient):
+    """Raises NotFound if no experience has a posted wait."""
+
+    DB = mock_DBClient.return_value.__enter__.return_value
+    DB.read_resort_top_waits.return_value = []
+    DB.read_update_times.return_value = {}
+
+    with pytest.raises(NotFound):
+        read_resort_top_experiences(_type="dining")
+
+
+@pytest.mark.parametrize(
+    "since, trimmed, truncated",
+    [
+        (None, "5-0", False),
+        ("0-0", None, False),
+        ("0-0", "5-0", True),
+        ("4-9", "5-0", True),
+        ("5-0", "5-0", False),
+        ("7-0", "5-0", False),
+    ],
+)
+@mock.patch("endpoints.DBClient")
+def test_read_changes_truncated(mock_DBClient, since, trimmed, truncated):
+    """Flags truncation only if events following `since` were trimmed."""
+
+    DB = mock_DBClient.return_value.__enter__.return_value
+    DB.read_update_time.return_value = "1000"
+    DB.read_changes.return_value = ([], trimmed)
+
+    kwargs = {} if since is None else {"since": since}
+    response, _, _ = read_changes("p", **kwargs)
+
+    assert response["truncated"] is truncated
+
+
+@pytest.fixture
+def export_slots(monkeypatch):
+    """Replace the export slots with a fresh single slot."""
+
+    slots = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(endpoints, "_export_slots", slots)
+    return slots
+
+
+def _mock_export_db(mock_DBClient):
+    DB = mock_DBClient.return_value.__enter__.return_value
+    DB.scan_park_ids.return_value = iter(["p"])
+    DB.read_update_time.return_value = "1000"
+    DB.scan_experiences.return_value = iter(
+        [("1", '{"id": "1", "name": "Dumbo", "type": "Attraction"}')]
+    )
+    DB.scan_history.return_value = iter(['{"t": 900.0, "waits": {"1": 5}}'])
+    return DB
+
+
+@mock.patch("endpoints.DBClient")
+def test_export_data_streams_csv(mock_DBClient, export_slots):
+    """Streams experiences and history as CSV, reading the DB lazily."""
+
+    _mock_export_db(mock_DBClient)
+
+    with flask.Flask(__name__).test_request_context():
+        response = export_data(format="csv")
+        assert response.is_streamed
+        mock_DBClient.assert_not_called()
+        body = response.get_data(as_text=True)
+        response.close()
+
+    assert response.mimetype == "text/csv"
+    assert response.headers["Content-Disposition"] == "attachment; filename=export.csv"
+    assert body.splitlines() == [
+        "record,parkId,id,name,type,status,postedWaitMinutes,time",
+        "experience,p,1,Dumbo,Attraction,,,1000.0",
+        "history,p,1,,,,5,900.0",
+    ]
+
+
+@mock.patch("endpoints.DBClient")
+def test_export_data_without_history(mock_DBClient, export_slots):
+    """Leaves out history when `history` is False."""
+
+    DB = _mock_export_db(mock_DBClient)
+
+    with flask.Flask(__name__).test_request_context():
+        response = export_data(history=False)
+        lines = response.get_data(as_text=True).splitlines()
+        response.close()
+
+    assert response.mimetype == "application/x-ndjson"
+    assert [json.loads(line)["record"] for line in lines] == ["experience"]
+    DB.scan_history.assert_not_called()
+
+
+@mock.patch("endpoints.DBClient")
+def test_export_data_limits_concurrent_exports(mock_DBClient, export_slots):
+    """Refuses exports beyond the limit until a stream is closed."""
+
+    _mock_export_db(mock_DBClient)
+
+    with flask.Flask(__name__).test_request_context():
+        response = export_data()
+        with pytest.raises(ServiceUnavailable):
+            export_data()
+        # Closing without reading the stream, as on a client disconnect.
+        response.close()
+
+    assert export_slots.acquire(blocking=False)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Tests for the profiling module.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+from unittest import mock
+
+import flask
+
+import profiling
+
+
+def _app():
+    app = flask.Flask(__name__)
+    app.add_url_rule("/", "index", lambda: "ok")
+    return app
+
+
+def test_init_app_disabled_without_profile_dir():
+    """Registers no hooks when PROFILE_DIR is not set."""
+
+    app = _app()
+    with mock.patch("profiling.PROFILE_DIR", None):
+        profiling.init_app(app)
+
+    assert not app.before_request_funcs
+    assert not app.after_request_funcs
+    assert not app.teardown_request_funcs
+    assert "X-Trace-Id" not in app.test_client().get("/").headers
+
+
+def test_init_app_profiles_requested_profile(tmp_path):
+    """Writes a profile named after the trace ID when asked to."""
+
+    app = _app()
+    with mock.patch("profiling.PROFILE_DIR", str(tmp_path)), mock.patch(
+        "profiling.PROFILE_SAMPLE_RATE", 0
+    ):
+        profiling.init_app(app)
+        client = app.test_client()
+        unprofiled = client.get("/")
+        profiled = client.get("/", headers={"X-Profile": "1"})
+
+    assert "X-Trace-Id" not in unprofiled.headers
+    assert profiled.headers["Cache-Control"] == "no-store"
+    trace_id = profiled.headers["X-Trace-Id"]
+    assert [path.name for path in tmp_path.iterdir()] == [f"request-{trace_id}.prof"]
+
+
+def test_init_app_keeps_sampled_profiles_out_of_caches(tmp_path):
+    """Marks responses to randomly sampled requests as not storable."""
+
+    app = flask.Flask(__name__)
+    app.add_url_rule(
+        "/", "index", lambda: ("ok", 200, {"Cache-Control": "public, max-age=60"})
+    )
+    with mock.patch("profiling.PROFILE_DIR", str(tmp_path)), mock.patch(
+        "profiling.PROFILE_SAMPLE_RATE", 1.0
+    ):
+        profiling.init_app(app)
+        response = app.test_client().get("/")
+
+    assert "X-Trace-Id" in response.headers
+    assert response.headers["Cache-Control"] == "no-store"
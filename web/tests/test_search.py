@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Tests for the search module.
+
+copyright: © 2019 by Erik R Berlin.
+license: MIT, see LICENSE for more details.
+
+"""
+
+import threading
+from unittest import mock
+
+from search import ExperienceIndex
+
+PARKS = {
+    "mk": [
+        {"id": "1", "name": "Space Mountain", "type": "Attraction"},
+        {"id": "2", "name": "Big Thunder Mountain Railroad", "type": "Attraction"},
+        {"id": "3", "name": "Mickey's PhilharMagic", "type": "Entertainment"},
+    ],
+    "ep": [
+        {"id": "4", "name": "Mission: SPACE", "type": "Attraction"},
+        {"id": "5", "name": "Spaceship Earth", "type": "Attraction"},
+    ],
+}
+
+
+def _index(parks=PARKS):
+    index = ExperienceIndex()
+    index.refresh(update_times={park_id: "1" for park_id in parks}, load=parks.get)
+    return index
+
+
+def _ids(matches):
+    return [match[1] for match in matches]
+
+
+def test_search_matches_token_prefixes():
+    """Matches query tokens against the start of name tokens."""
+
+    matches = _index().search("moun")
+
+    assert matches == [
+        ("mk", "2", "Big Thunder Mountain Railroad", "Attraction"),
+        ("mk", "1", "Space Mountain", "Attraction"),
+    ]
+
+
+def test_search_ranks_names_starting_with_query_first():
+    """Ranks names starting with the query before other matches."""
+
+    assert _ids(_index().search("SPACE")) == ["1", "5", "4"]
+
+
+def test_search_requires_all_tokens():
+    """Only matches names containing every token of the query."""
+
+    assert _ids(_index().search("space mou")) == ["1"]
+    assert _ids(_index().search("mou thu big")) == ["2"]
+    assert _index().search("space railroad") == []
+
+
+def test_search_filters_by_park():
+    """Only returns matches in the given park."""
+
+    index = _index()
+
+    assert _ids(index.search("space", park_id="ep")) == ["5", "4"]
+    assert _ids(index.search("mountain", park_id="mk")) == ["2", "1"]
+    assert index.search("mountain", park_id="ep") == []
+    assert index.search("space", park_id="missing") == []
+
+
+def test_search_limits_matches():
+    """Returns the best `limit` matches."""
+
+    assert _ids(_index().search("s", limit=2)) == ["1", "5"]
+
+
+def test_search_without_tokens():
+    """Returns no matches for a query without word characters."""
+
+    assert _index().search(" -- ") == []
+
+
+def test_refresh_skips_unchanged_parks():
+    """Only loads parks with a new update time."""
+
+    load = mock.Mock(side_effect=PARKS.get)
+    index = ExperienceIndex()
+    index.refresh(update_times={"mk": "1", "ep": "1"}, load=load)
+    index.refresh(update_times={"mk": "1", "ep": "2"}, load=load)
+
+    assert [c.args for c in load.call_args_list] == [("mk",), ("ep",), ("ep",)]
+    assert index.update_times == {"mk": "1", "ep": "2"}
+    assert index.refreshed is not None
+
+
+def test_refresh_rebuilds_changed_parks():
+    """Reflects renamed and removed experiences and parks."""
+
+    index = _index()
+    parks = {"mk": [{"id": "1", "name": "Space Ranger", "type": "Attraction"}]}
+    index.refresh(update_times={"mk": "2"}, load=parks.get)
+
+    assert _ids(index.search("space")) == ["1"]
+    assert index.search("mountain") == []
+    assert index.search("earth") == []
+
+
+def test_start_refresher_refreshes_in_background():
+    """Refreshes from one daemon thread, however often it's started."""
+
+    index = ExperienceIndex()
+    refreshes = []
+    repeated = threading.Event()
+
+    def refresh():
+        refreshes.append(threading.current_thread())
+        index.refresh(update_times={"mk": "1"}, load=PARKS.get)
+        if len(refreshes) == 3:
+            repeated.set()
+
+    index.start_refresher(interval=0.01, refresh=refresh)
+    index.start_refresher(interval=0.01, refresh=refresh)
+
+    assert index.wait_ready(timeout=1)
+    assert _ids(index.search("space")) == ["1"]
+    assert repeated.wait(timeout=1)
+    assert len(set(refreshes[:3])) == 1
+    assert refreshes[0].daemon
+
+
+def test_start_refresher_survives_failed_refresh():
+    """Keeps refreshing after a refresh raises."""
+
+    index = ExperienceIndex()
+    retried = threading.Event()
+    calls = []
+
+    def refresh():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError
+        retried.set()
+
+    with mock.patch("search.logger") as mock_logger:
+        index.start_refresher(interval=0.01, refresh=refresh)
+        assert retried.wait(timeout=1)
+
+    mock_logger.exception.assert_called_once()
+    assert not index.wait_ready(timeout=0)